@@ -4,12 +4,16 @@ Flask application for Green Level AI Counselor Chatbot.
 import os
 import logging
 import socket
-from atexit import register
-from flask import Flask, render_template, request, jsonify
+import threading
+from types import MappingProxyType
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from dotenv import load_dotenv
-from apscheduler.schedulers.background import BackgroundScheduler  # pyright: ignore[reportMissingImports]
-from chatbot import get_chatbot
-from utils import get_or_create_session, append_message, clear_stale_sessions
+from waitress import serve
+from chatbot import get_chatbot, CHAT_MODEL, RAG_ERROR_RESPONSE
+from utils import (
+    get_or_create_session, append_message,
+    response_cache_key, get_cached_response, cache_response
+)
 
 # Load environment variables
 load_dotenv()
@@ -20,6 +24,23 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# How long cached answers are reused. Quick actions always ask the same
+# question, so theirs can live much longer than freeform chat answers.
+QUICK_ACTION_CACHE_SECONDS = 24 * 60 * 60
+CHAT_CACHE_SECONDS = 60 * 60
+
+# Sent on /chat/stream in place of further text when an answer fails partway,
+# so the page can show its error state. Model output never contains a NUL.
+STREAM_ERROR_MARKER = "\x00"
+
+# Map quick actions to questions
+_ACTION_QUESTIONS = MappingProxyType({
+    "graduation_requirements": "What are the graduation requirements at Green Level High School?",
+    "course_planning": "Help me plan my courses for next year. What should I consider?",
+    "college_prep": "What are some college preparation tips? Tell me about AP vs Honors courses.",
+    "meet_counselor": "Who are the counselors at Green Level and how can I contact them?"
+})
+
 # Initialize chatbot on startup
 try:
     chatbot = get_chatbot()
@@ -28,36 +49,32 @@ except Exception as e:
     logger.error(f"Failed to initialize chatbot: {e}")
     chatbot = None
 
-# Initialize scheduler for stale session cleanup
-# Only initialize once (prevents duplicate scheduler in Flask reloader)
-scheduler = None
-
-def initialize_scheduler():
-    """Initialize and start the scheduler for stale session cleanup."""
-    global scheduler
-    if scheduler is None or not scheduler.running:
-        scheduler = BackgroundScheduler()
-        scheduler.add_job(
-            func=clear_stale_sessions,
-            trigger="interval",
-            minutes=5,
-            id='clear_stale_sessions',
-            name='Clear stale sessions every 5 minutes'
-        )
-        scheduler.start()
-        logger.info("Scheduler started: Stale session cleanup every 5 minutes")
-
-# Initialize scheduler
-initialize_scheduler()
-
-# Register shutdown handler
-@register
-def shutdown_scheduler():
-    """Shutdown scheduler on app termination."""
-    global scheduler
-    if scheduler and scheduler.running:
-        scheduler.shutdown()
-        logger.info("Scheduler stopped")
+
+def stream_cached_query(question, conversation, ttl_seconds, use_cache=True):
+    """Stream an answer to a question with RAG, reusing a cached answer when one is available."""
+    key = response_cache_key(question, CHAT_MODEL)
+    if use_cache:
+        cached = get_cached_response(key)
+        if cached is not None:
+            yield cached
+            return
+    
+    pieces = []
+    for piece in chatbot.query_with_rag_stream(
+        question=question,
+        conversation_history=conversation
+    ):
+        pieces.append(piece)
+        yield piece
+    
+    response = "".join(pieces)
+    if use_cache and not response.endswith(RAG_ERROR_RESPONSE):
+        cache_response(key, response, ttl_seconds)
+
+
+def cached_query(question, conversation, ttl_seconds, use_cache=True):
+    """Answer a question with RAG, reusing a cached answer when one is available."""
+    return "".join(stream_cached_query(question, conversation, ttl_seconds, use_cache))
 
 
 @app.route("/")
@@ -89,11 +106,10 @@ def chat():
         # Get conversation history (before adding current message)
         conversation = get_or_create_session(session_id)
         
-        # Query chatbot with RAG (pass history without current message)
-        response = chatbot.query_with_rag(
-            question=message,
-            conversation_history=conversation
-        )
+        # Query chatbot with RAG (pass history without current message).
+        # Answers to follow-up questions depend on the history, so only
+        # the first message of a conversation is served from the cache.
+        response = cached_query(message, conversation, CHAT_CACHE_SECONDS, use_cache=not conversation)
         
         # Add both user message and assistant response to history after getting response
         append_message(session_id, "user", message)
@@ -112,6 +128,47 @@ def chat():
         }), 500
 
 
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """Handle chat messages from the frontend, streaming the response as plain text."""
+    if not chatbot:
+        return jsonify({
+            "error": "Chatbot not available. Please check server configuration.",
+            "session_id": request.json.get("session_id", "")
+        }), 500
+    
+    data = request.json or {}
+    message = data.get("message", "").strip()
+    session_id = data.get("session_id", "default")
+    
+    if not message:
+        return jsonify({
+            "error": "Message cannot be empty.",
+            "session_id": session_id
+        }), 400
+    
+    # Get conversation history (before adding current message)
+    conversation = get_or_create_session(session_id)
+    
+    def generate():
+        pieces = []
+        try:
+            # Same caching rule as /chat: only first messages are served from the cache
+            for piece in stream_cached_query(message, conversation, CHAT_CACHE_SECONDS, use_cache=not conversation):
+                pieces.append(piece)
+                yield piece
+        except Exception as e:
+            logger.error(f"Error in chat stream endpoint: {e}")
+            yield STREAM_ERROR_MARKER
+            return
+        
+        # Add both user message and assistant response to history once the response is complete
+        append_message(session_id, "user", message)
+        append_message(session_id, "assistant", "".join(pieces))
+    
+    return Response(stream_with_context(generate()), mimetype="text/plain")
+
+
 @app.route("/quick-action", methods=["POST"])
 def quick_action():
     """Handle quick action button clicks."""
@@ -126,15 +183,7 @@ def quick_action():
         action = data.get("action", "").strip()
         session_id = data.get("session_id", "default")
         
-        # Map actions to questions
-        action_questions = {
-            "graduation_requirements": "What are the graduation requirements at Green Level High School?",
-            "course_planning": "Help me plan my courses for next year. What should I consider?",
-            "college_prep": "What are some college preparation tips? Tell me about AP vs Honors courses.",
-            "meet_counselor": "Who are the counselors at Green Level and how can I contact them?"
-        }
-        
-        question = action_questions.get(action.lower(), "")
+        question = _ACTION_QUESTIONS.get(action.lower(), "")
         if not question:
             return jsonify({
                 "error": "Invalid action.",
@@ -144,11 +193,9 @@ def quick_action():
         # Get conversation history (before adding current message)
         conversation = get_or_create_session(session_id)
         
-        # Query chatbot (pass history without current message)
-        response = chatbot.query_with_rag(
-            question=question,
-            conversation_history=conversation
-        )
+        # Query chatbot (pass history without current message). As in /chat,
+        # an answer that saw a conversation's history isn't cached for everyone.
+        response = cached_query(question, conversation, QUICK_ACTION_CACHE_SECONDS, use_cache=not conversation)
         
         # Add both user message and assistant response to history after getting response
         append_message(session_id, "user", question)
@@ -168,17 +215,17 @@ def quick_action():
         }), 500
 
 
-def find_available_port(start_port=5000, max_attempts=10):
-    """Find an available port starting from start_port."""
-    for i in range(max_attempts):
-        port = start_port + i
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            try:
-                s.bind(('', port))
-                return port
-            except OSError:
-                continue
-    raise RuntimeError(f"Could not find an available port after {max_attempts} attempts")
+def bind_server_socket(preferred_port=5000):
+    """Bind the preferred port, or let the OS pick a free one if it is taken."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # On Windows SO_REUSEADDR lets a second process share a port that is in use
+    if os.name != "nt":
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind(("0.0.0.0", preferred_port))
+    except OSError:
+        sock.bind(("0.0.0.0", 0))
+    return sock
 
 
 if __name__ == "__main__":
@@ -188,12 +235,21 @@ if __name__ == "__main__":
         logger.error("Please create a .env file with: OPENAI_API_KEY=your_key_here")
         exit(1)
     
-    # Find available port (start with 5000, try next if in use)
-    port = find_available_port(5000)
+    # Bind port 5000, or a free port picked by the OS if it is in use.
+    # Serving the already-bound socket means nothing can take the port
+    # between choosing it and starting the server.
+    sock = bind_server_socket(5000)
+    port = sock.getsockname()[1]
     if port != 5000:
         logger.info(f"Port 5000 is in use. Using port {port} instead.")
     
+    # Load the vector store in the background so the first question doesn't
+    # wait on it, while the server can already answer greetings
+    if chatbot is not None:
+        threading.Thread(target=chatbot.warm_up, daemon=True).start()
+    
     logger.info(f"Starting Flask app on http://localhost:{port}")
-    # Run the app
-    app.run(host="0.0.0.0", port=port, debug=True)
+    # Run the app with a multithreaded WSGI server so slow OpenAI calls
+    # don't queue every other request behind them
+    serve(app, sockets=[sock], threads=16)
 
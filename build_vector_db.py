@@ -4,308 +4,843 @@ Run this script to initialize or rebuild the vector database.
 
 Usage:
     python build_vector_db.py
+    python build_vector_db.py --batch-api   # Cheaper offline build via the OpenAI Batch API
 """
 import os
 import json
+import hashlib
+import sqlite3
 import re
-from typing import List
+import time
+import uuid
+import argparse
+import importlib.util
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+import httpx
+import tiktoken
 from dotenv import load_dotenv
-from langchain_community.vectorstores import Chroma
+from openai import OpenAI
 from langchain_community.embeddings import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
+# pypdf, the text splitter and Chroma are only imported when a build runs, so
+# the chatbot can import this module's settings without loading them
+PDF_SUPPORT = importlib.util.find_spec("pypdf") is not None
+if not PDF_SUPPORT:
+    print("Warning: pypdf not installed. PDF processing disabled.")
+
 try:
-    from pypdf import PdfReader
-    PDF_SUPPORT = True
+    import orjson
+    ORJSON_SUPPORT = True
 except ImportError:
-    PDF_SUPPORT = False
-    print("Warning: pypdf not installed. PDF processing disabled.")
+    ORJSON_SUPPORT = False
 
 # Load environment variables
 load_dotenv()
 
+# Paths
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+PDF_DIR = os.path.join(DATA_DIR, "pdf_docs")
+PERSIST_DIRECTORY = os.path.join(BASE_DIR, "chroma_db")
+
+# Data files to index, in load order
+JSON_FILES = (
+    "glhs_info.json",
+    "glhs_course_catalog.json",
+    "glhs_graduation_requirments.json",
+    "glhs_clubs.json",
+    "clubs.json",
+    "glhs_college_pathways.json",
+    "glhs_college_filters.json",
+    "academic_difficulty_profile.json",
+    "honors_difficulty_profile.json",
+    "ap_difficulty_profile.json",
+    "majors.ljson",
+    "oppurtunities_database.json",
+    "class_requirements.json",
+    "application_glossary.json",
+    "system_metadata.json",
+    "wcpss_planning_guide_glhs.json",
+    "class_directory.json",
+    "freshman_courses.json",
+    "sophmore_courses.json",
+    "junior_courses.json",
+    "wake_tech.json"
+)
+
 # Configuration
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
-EMBEDDING_MODEL = "text-embedding-ada-002"
+CHUNK_SIZE = 400  # tokens, measured with the embedding model's tokenizer
+CHUNK_OVERLAP = 40
+# Paragraphs, lines, then the commas between compact JSON fields; the final ""
+# always lets the splitter fall back to cutting by size
+CHUNK_SEPARATORS = ["\n\n", "\n", ", ", ",", " ", ""]
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 512  # text-embedding-3 models can return shortened vectors
+EMBEDDING_BATCH_MAX_ITEMS = 2048  # OpenAI limit on inputs per embeddings request
+EMBEDDING_BATCH_MAX_TOKENS = 8000  # Stay under the 8191-token request budget
+EMBEDDING_WORKERS = 16  # Concurrent embeddings requests
+LOAD_WORKERS = 8  # Threads for reading data files and splitting documents
+BATCH_API_POLL_SECONDS = 30
+PDF_READ_BUFFER_BYTES = 1 << 20
+EMBEDDING_CACHE_PATH = os.path.join(BASE_DIR, "embedding_cache.sqlite")
+EMBEDDING_CACHE_LOOKUP_BATCH = 500  # Hashes per SELECT, under SQLite's bound-parameter limit
 
+# Stored on the Chroma collection so readers can check they embed queries the same way
+EMBEDDING_METADATA = {
+    # Bump when the stored chunk metadata changes, so old databases get rebuilt
+    "index_version": 4,
+    "embedding_model": EMBEDDING_MODEL,
+    "embedding_dim": EMBEDDING_DIM,
+    "chunk_size": CHUNK_SIZE,
+    "chunk_overlap": CHUNK_OVERLAP
+}
+COLLECTION_NAME = "glhs"
+# HNSW settings are pinned so rebuilds of the same data produce the same index
+COLLECTION_METADATA = {
+    **EMBEDDING_METADATA,
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 16
+}
+CHROMA_ADD_BATCH_SIZE = 5000  # Stays under Chroma's per-call insert limit
 
-def load_json_files(data_dir: str) -> List[Document]:
-    """Load all JSON files from the data directory and convert to documents."""
-    documents = []
-    json_files = [
-        "glhs_info.json",
-        "glhs_course_catalog.json",
-        "glhs_graduation_requirments.json",
-        "glhs_clubs.json",
-        "clubs.json",
-        "glhs_college_pathways.json",
-        "glhs_college_filters.json",
-        "academic_difficulty_profile.json",
-        "honors_difficulty_profile.json",
-        "ap_difficulty_profile.json",
-        "majors.ljson",
-        "oppurtunities_database.json",
-        "class_requirements.json",
-        "application_glossary.json",
-        "system_metadata.json",
-        "wcpss_planning_guide_glhs.json",
-        "class_directory.json",
-        "freshman_courses.json",
-        "sophmore_courses.json",
-        "junior_courses.json",
-        "wake_tech.json"
-    ]
+
+def read_json(file_path: str):
+    """Parse a JSON file, using orjson when it is installed."""
+    if ORJSON_SUPPORT:
+        with open(file_path, "rb") as f:
+            return orjson.loads(f.read())
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dump_json(data) -> str:
+    """Serialize data as compact JSON text, using orjson when it is installed."""
+    # Indentation only adds whitespace tokens to embed
+    if ORJSON_SUPPORT:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _field_label(key: str) -> str:
+    """Turn a JSON key like 'prerequisite_required' into 'Prerequisite Required'."""
+    label = key.replace("_", " ").title()
+    return label.replace("Ap ", "AP ") if label != "Ap" else "AP"
+
+
+def _format_value(value) -> str:
+    """Render a JSON scalar, or a list of scalars, as plain text for embedding."""
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value)
+    return str(value)
+
+
+def _is_nested(value) -> bool:
+    """Whether a JSON value needs its own indented lines rather than fitting after its label."""
+    return isinstance(value, dict) or (
+        isinstance(value, list) and any(isinstance(v, (dict, list)) for v in value)
+    )
+
+
+def _format_nested(value, indent: str = "") -> str:
+    """Render a nested JSON object or list as indented 'Label: value' lines and bullets."""
+    if isinstance(value, dict):
+        return _format_fields(value, indent=indent).rstrip("\n")
     
-    for json_file in json_files:
-        file_path = os.path.join(data_dir, json_file)
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                
-                # Special handling for clubs.json to create separate documents per club
-                if json_file == "clubs.json" and isinstance(data, dict) and "clubs" in data:
-                    # Create a separate document for each club to improve retrieval accuracy
-                    for club in data.get("clubs", []):
-                        # Format club information as readable text
-                        club_text = f"Club Name: {club.get('name', 'N/A')}\n"
-                        club_text += f"Category: {club.get('category', 'N/A')}\n"
-                        if club.get('advisors'):
-                            advisors = club['advisors'] if isinstance(club['advisors'], list) else [club['advisors']]
-                            club_text += f"Advisors: {', '.join(advisors)}\n"
-                        if club.get('student_contacts'):
-                            contacts = club['student_contacts'] if isinstance(club['student_contacts'], list) else [club['student_contacts']]
-                            club_text += f"Student Contacts: {', '.join(contacts)}\n"
-                        if club.get('activities'):
-                            club_text += f"Activities: {club.get('activities')}\n"
-                        if club.get('meeting_day'):
-                            club_text += f"Meeting Day: {club.get('meeting_day')}\n"
-                        if club.get('location'):
-                            club_text += f"Location: {club.get('location')}\n"
-                        
-                        doc = Document(
-                            page_content=club_text,
-                            metadata={
-                                "source": json_file,
-                                "type": "json",
-                                "file": json_file,
-                                "club_name": club.get('name', ''),
-                                "category": club.get('category', '')
-                            }
-                        )
-                        documents.append(doc)
-                    print(f"✓ Loaded JSON: {json_file} ({len(data.get('clubs', []))} clubs as separate documents)")
-                else:
-                    # Convert JSON to text representation for other files
-                    # For structured data, create a readable text format
-                    if isinstance(data, dict):
-                        text_content = json.dumps(data, indent=2, ensure_ascii=False)
-                    elif isinstance(data, list):
-                        text_content = json.dumps(data, indent=2, ensure_ascii=False)
-                    else:
-                        text_content = str(data)
-                    
-                    # Create document with metadata
-                    doc = Document(
-                        page_content=text_content,
-                        metadata={
-                            "source": json_file,
-                            "type": "json",
-                            "file": json_file
-                        }
-                    )
-                    documents.append(doc)
-                    print(f"✓ Loaded JSON: {json_file}")
-            except Exception as e:
-                print(f"✗ Error loading {json_file}: {e}")
+    lines = []
+    for item in value:
+        if isinstance(item, dict):
+            # The item's first field goes on the bullet line, the rest line up under it
+            fields = _format_fields(item, indent=indent + "  ").rstrip("\n")
+            lines.append(f"{indent}- {fields[len(indent) + 2:]}")
+        elif _is_nested(item):
+            lines.append(f"{indent}-\n{_format_nested(item, indent + '  ')}")
+        else:
+            lines.append(f"{indent}- {_format_value(item)}")
+    return "\n".join(lines)
+
+
+def _format_fields(record: dict, skip: tuple = (), indent: str = "") -> str:
+    """Render a JSON record as 'Label: value' lines, skipping empty fields and indenting nested ones."""
+    lines = []
+    for key, value in record.items():
+        if key in skip or value is None or value == "" or value == [] or value == {}:
+            continue
+        if _is_nested(value):
+            lines.append(f"{indent}{_field_label(key)}:\n{_format_nested(value, indent + '  ')}")
+        else:
+            lines.append(f"{indent}{_field_label(key)}: {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _flatten_clubs(data, json_file: str) -> List[Document]:
+    """Create a separate document for each club to improve retrieval accuracy."""
+    if not isinstance(data, dict) or "clubs" not in data:
+        return []
     
+    documents = []
+    for club in data.get("clubs", []):
+        # Format club information as readable text
+        club_text = f"Club Name: {club.get('name', 'N/A')}\n"
+        club_text += f"Category: {club.get('category', 'N/A')}\n"
+        if club.get('advisors'):
+            advisors = club['advisors'] if isinstance(club['advisors'], list) else [club['advisors']]
+            club_text += f"Advisors: {', '.join(advisors)}\n"
+        if club.get('student_contacts'):
+            contacts = club['student_contacts'] if isinstance(club['student_contacts'], list) else [club['student_contacts']]
+            club_text += f"Student Contacts: {', '.join(contacts)}\n"
+        if club.get('activities'):
+            club_text += f"Activities: {club.get('activities')}\n"
+        if club.get('meeting_day'):
+            club_text += f"Meeting Day: {club.get('meeting_day')}\n"
+        if club.get('location'):
+            club_text += f"Location: {club.get('location')}\n"
+        
+        doc = Document(
+            page_content=club_text,
+            metadata={
+                "source": json_file,
+                "type": "json",
+                "file": json_file,
+                "club_name": club.get('name', ''),
+                "category": club.get('category', '')
+            }
+        )
+        documents.append(doc)
     return documents
 
 
-def is_glhs_relevant(text: str) -> bool:
-    """
-    Filter content to only include GLHS-relevant information.
-    Excludes content specific to other schools or general WCPSS info not applicable to GLHS.
-    """
-    text_lower = text.lower()
-    
-    # GLHS-specific keywords (positive indicators)
-    glhs_keywords = [
-        "green level",
-        "glhs",
-        "green level high school",
-        # Include general course information that applies to all schools
-        "course",
-        "graduation",
-        "credit",
-        "prerequisite",
-        "honors",
-        "ap ",
-        "advanced placement",
-        "gpa",
-        "grade point average",
-        "schedule",
-        "registration",
-        "elective",
-        "required",
-        "math",
-        "science",
-        "english",
-        "social studies",
-        "world language",
-        "arts",
-        "cte",
-        "healthful living",
-        "physical education"
-    ]
+def _flatten_courses(data, json_file: str) -> List[Document]:
+    """Create one document per course in a grade-level course list, plus one for its notes."""
+    if not isinstance(data, dict) or "categories" not in data:
+        return []
     
-    # School-specific keywords to exclude (negative indicators)
-    exclude_keywords = [
-        "apex high school",
-        "cary high school",
-        "garner high school",
-        "holly springs high school",
-        "leesville road high school",
-        "middle creek high school",
-        "panther creek high school",
-        "wakefield high school",
-        "wake forest high school",
-        "enloe high school",
-        "millbrook high school",
-        "sanderson high school",
-        "broughton high school",
-        "athens drive high school",
-        "fuquay-varina high school",
-        "green hope high school",
-        "heritage high school",
-        "hillside high school",
-        "knightdale high school",
-        "rolesville high school",
-        "southeast raleigh",
-        "southeast raleigh high school",
-        "wake early college",
-        "wake stem",
-        "wake young men's",
-        "wake young women's"
-    ]
+    label = data.get("label", json_file)
+    metadata = {
+        "source": json_file,
+        "type": "json",
+        "file": json_file,
+        "grade_level": data.get("grade_level", "")
+    }
     
-    # Check for exclusion keywords first (higher priority)
-    for exclude in exclude_keywords:
-        if exclude in text_lower:
-            return False
+    overview = f"{label}\n" + _format_fields(data, skip=("label", "notes", "categories"))
+    if data.get("notes"):
+        overview += "Notes:\n" + "\n".join(f"- {note}" for note in data["notes"]) + "\n"
+    documents = [Document(page_content=overview, metadata=dict(metadata))]
     
-    # Check for GLHS or general keywords
-    for keyword in glhs_keywords:
-        if keyword in text_lower:
-            return True
+    for group, subjects in data["categories"].items():
+        for subject, courses in subjects.items():
+            for course in courses:
+                course_text = f"Course: {course.get('name', 'N/A')}\n"
+                course_text += f"Offered In: {label}\n"
+                course_text += f"Category: {_field_label(group)} - {_field_label(subject)}\n"
+                course_text += _format_fields(course, skip=("name",))
+                documents.append(Document(
+                    page_content=course_text,
+                    metadata={**metadata, "course_name": course.get("name", "")}
+                ))
+    return documents
+
+
+def _flatten_planning_guide(data, json_file: str) -> List[Document]:
+    """Create one document per planning guide section, plus one for the guide's details."""
+    if not isinstance(data, dict) or "sections" not in data:
+        return []
     
-    # If no specific keywords found, include general educational content
-    # that could be relevant (course descriptions, requirements, etc.)
-    educational_keywords = [
-        "requirement",
-        "curriculum",
-        "program",
-        "pathway",
-        "endorsement",
-        "diploma"
-    ]
+    metadata = {"source": json_file, "type": "json", "file": json_file}
+    overview = ""
+    for key, value in data.items():
+        if key != "sections" and isinstance(value, dict):
+            overview += f"{_field_label(key)}\n" + _format_fields(value)
+    documents = [Document(page_content=overview, metadata=dict(metadata))] if overview else []
     
-    for keyword in educational_keywords:
-        if keyword in text_lower:
-            return True
+    for section in data["sections"]:
+        documents.append(Document(
+            page_content=f"Section: {section.get('section_title', '')}\n{section.get('content', '')}",
+            metadata={**metadata, "section_title": section.get("section_title", "")}
+        ))
+    return documents
+
+
+# Provenance and bookkeeping sections of a program guide that say nothing about the program itself
+METADATA_SECTIONS = (
+    "developer_metadata", "confidence", "change_log", "json_schema", "missing_fields",
+    "sources", "sources.invalid_urls", "raw_snippets", "assumptions"
+)
+
+
+def _flatten_sections(data, json_file: str) -> List[Document]:
+    """Create one document per top-level section of a program guide, plus one for its summary."""
+    if not isinstance(data, dict):
+        return []
+    
+    title = data.get("program_name", json_file)
+    metadata = {"source": json_file, "type": "json", "file": json_file}
+    overview = f"{title}\n" + _format_fields(
+        {key: value for key, value in data.items() if not isinstance(value, (dict, list))},
+        skip=("program_name",)
+    )
+    documents = [Document(page_content=overview, metadata=dict(metadata))]
     
-    # Default: exclude if no clear relevance
-    return False
+    for key, value in data.items():
+        if key in METADATA_SECTIONS:
+            continue
+        if isinstance(value, dict):
+            body = _format_fields(value)
+        elif isinstance(value, list) and value:
+            body = _format_nested(value) + "\n"
+        else:
+            continue
+        documents.append(Document(
+            page_content=f"{title}\nSection: {_field_label(key)}\n{body}",
+            metadata={**metadata, "section_title": _field_label(key)}
+        ))
+    return documents
 
 
-def load_pdf_files(pdf_dir: str) -> List[Document]:
-    """Load PDF files from the pdf_docs directory and filter for GLHS-relevant content."""
-    if not PDF_SUPPORT:
+# Files the chatbot routes on when they show up in the retrieved documents
+JSON_TOPICS = {
+    "wake_tech.json": "wake_tech",
+}
+
+
+# Files whose records are embedded as separate documents instead of one JSON dump
+JSON_FLATTENERS = {
+    "clubs.json": _flatten_clubs,
+    "freshman_courses.json": _flatten_courses,
+    "sophmore_courses.json": _flatten_courses,
+    "junior_courses.json": _flatten_courses,
+    "wcpss_planning_guide_glhs.json": _flatten_planning_guide,
+    "wake_tech.json": _flatten_sections,
+}
+
+
+def _load_json_file(json_file: str, file_path: str) -> Tuple[List[Document], str]:
+    """Load one JSON file as documents, returning them with a status line to print."""
+    try:
+        data = read_json(file_path)
+        
+        # Split files with a known layout into one document per record
+        flattener = JSON_FLATTENERS.get(json_file)
+        flattened = flattener(data, json_file) if flattener else []
+        if flattened:
+            return flattened, f"✓ Loaded JSON: {json_file} ({len(flattened)} separate documents)"
+        
+        # Convert JSON to text representation for other files
+        # For structured data, create a readable text format
+        if isinstance(data, (dict, list)):
+            text_content = dump_json(data)
+        else:
+            text_content = str(data)
+        
+        # Create document with metadata
+        doc = Document(
+            page_content=text_content,
+            metadata={
+                "source": json_file,
+                "type": "json",
+                "file": json_file
+            }
+        )
+        return [doc], f"✓ Loaded JSON: {json_file}"
+    except Exception as e:
+        return [], f"✗ Error loading {json_file}: {e}"
+
+
+def load_json_files(data_dir: str) -> List[Document]:
+    """Load all JSON files from the data directory and convert to documents."""
+    files = [
+        (json_file, os.path.join(data_dir, json_file))
+        for json_file in JSON_FILES
+        if os.path.exists(os.path.join(data_dir, json_file))
+    ]
+    if not files:
         return []
     
+    # Reading and parsing is mostly I/O, so threads are enough; map keeps the load order
     documents = []
+    with ThreadPoolExecutor(max_workers=min(len(files), LOAD_WORKERS)) as executor:
+        for file_documents, status in executor.map(lambda f: _load_json_file(*f), files):
+            print(status)
+            documents.extend(file_documents)
     
-    if not os.path.exists(pdf_dir):
-        return documents
-    
-    pdf_files = [f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]
+    return documents
+
+
+# GLHS-specific keywords (positive indicators)
+GLHS_KEYWORDS = [
+    "green level",
+    "glhs",
+    "green level high school",
+    # Include general course information that applies to all schools
+    "course",
+    "graduation",
+    "credit",
+    "prerequisite",
+    "honors",
+    "ap ",
+    "advanced placement",
+    "gpa",
+    "grade point average",
+    "schedule",
+    "registration",
+    "elective",
+    "required",
+    "math",
+    "science",
+    "english",
+    "social studies",
+    "world language",
+    "arts",
+    "cte",
+    "healthful living",
+    "physical education"
+]
+
+# School-specific keywords to exclude (negative indicators)
+EXCLUDE_KEYWORDS = [
+    "apex high school",
+    "cary high school",
+    "garner high school",
+    "holly springs high school",
+    "leesville road high school",
+    "middle creek high school",
+    "panther creek high school",
+    "wakefield high school",
+    "wake forest high school",
+    "enloe high school",
+    "millbrook high school",
+    "sanderson high school",
+    "broughton high school",
+    "athens drive high school",
+    "fuquay-varina high school",
+    "green hope high school",
+    "heritage high school",
+    "hillside high school",
+    "knightdale high school",
+    "rolesville high school",
+    "southeast raleigh",
+    "southeast raleigh high school",
+    "wake early college",
+    "wake stem",
+    "wake young men's",
+    "wake young women's"
+]
+
+# General educational content that could be relevant (course descriptions, requirements, etc.)
+EDUCATIONAL_KEYWORDS = [
+    "requirement",
+    "curriculum",
+    "program",
+    "pathway",
+    "endorsement",
+    "diploma"
+]
+
+
+# General course/graduation info kept from PDF pages that aren't otherwise relevant
+PDF_FALLBACK_KEYWORDS = [
+    "course",
+    "graduation",
+    "credit",
+    "requirement",
+    "curriculum",
+    "program",
+    "pathway"
+]
+
+
+def _compile_keywords(keywords: List[str]) -> re.Pattern:
+    """
+    Compile keywords into one case-insensitive alternation so a single regex
+    pass finds any of them without making a lowercased copy of the text.
+    """
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords), re.IGNORECASE)
+
+
+_EXCLUDE_RE = _compile_keywords(EXCLUDE_KEYWORDS)
+# Exclusions come first so they win when both kinds of keyword start at the same place
+_KEYWORD_RE = re.compile(
+    f"(?P<exclude>{_EXCLUDE_RE.pattern})|(?P<include>{_compile_keywords(GLHS_KEYWORDS + EDUCATIONAL_KEYWORDS).pattern})",
+    re.IGNORECASE
+)
+_PDF_FALLBACK_RE = _compile_keywords(PDF_FALLBACK_KEYWORDS)
+
+
+def is_glhs_relevant(text: str) -> bool:
+    """
+    Filter content to only include GLHS-relevant information.
+    Excludes content specific to other schools or general WCPSS info not applicable to GLHS.
+    """
+    # Find the first keyword of either kind. Exclusion keywords have higher priority,
+    # and no clear relevance means exclude
+    match = _KEYWORD_RE.search(text)
+    if match is None or match.lastgroup == "exclude":
+        return False
     
-    for pdf_file in pdf_files:
-        file_path = os.path.join(pdf_dir, pdf_file)
-        try:
-            print(f"Processing PDF: {pdf_file}...")
-            reader = PdfReader(file_path)
+    # Only the rest of the text can still hold an exclusion keyword
+    return _EXCLUDE_RE.search(text, match.start()) is None
+
+
+def _page_has_text_layer(page) -> bool:
+    """
+    Check whether a PDF page has any fonts, directly or through a form XObject.
+    Scanned pages are just images, so extracting their text is wasted work.
+    """
+    try:
+        resources = page.get("/Resources")
+        if resources is None:
+            return False
+        resources = resources.get_object()
+        if "/Font" in resources:
+            return True
+        xobjects = resources.get("/XObject")
+        if xobjects is None:
+            return False
+        xobjects = xobjects.get_object()
+        return any(xobjects[name].get_object().get("/Subtype") == "/Form" for name in xobjects)
+    except Exception:
+        # Let extract_text decide when the resources can't be read
+        return True
+
+
+def _extract_pdf(file_path: str) -> Optional[Document]:
+    """
+    Extract the GLHS-relevant text of one PDF as a Document, or None if nothing is kept.
+    Runs in a worker process, so it only takes a picklable path.
+    """
+    pdf_file = os.path.basename(file_path)
+    try:
+        print(f"Processing PDF: {pdf_file}...")
+        # Given a path, PdfReader copies the whole file into memory first; reading
+        # through a buffered file object only loads the objects pages refer to
+        from pypdf import PdfReader
+        with open(file_path, "rb", buffering=PDF_READ_BUFFER_BYTES) as f:
+            reader = PdfReader(f, strict=False)
             
-            all_text = []
+            filtered_sections = []
             total_pages = len(reader.pages)
             relevant_pages = 0
             
+            # Filter each page as it is extracted so the full PDF text is never
+            # held in memory more than once
             for page_num, page in enumerate(reader.pages, 1):
+                if not _page_has_text_layer(page):
+                    continue
                 try:
                     page_text = page.extract_text()
-                    if page_text and page_text.strip():
-                        # Filter for GLHS-relevant content
-                        if is_glhs_relevant(page_text):
-                            all_text.append(page_text)
-                            relevant_pages += 1
-                        else:
-                            # Still include if it's general course/graduation info
-                            # but skip school-specific sections
-                            if any(keyword in page_text.lower() for keyword in 
-                                   ["course", "graduation", "credit", "requirement", 
-                                    "curriculum", "program", "pathway"]):
-                                all_text.append(page_text)
-                                relevant_pages += 1
                 except Exception as e:
                     print(f"  Warning: Could not extract text from page {page_num}: {e}")
                     continue
-            
-            if all_text:
-                full_text = "\n\n".join(all_text)
                 
-                # Additional filtering: remove sections that are clearly not GLHS-specific
-                # Split by common section headers and filter
-                sections = re.split(r'\n{2,}', full_text)
-                filtered_sections = []
+                if not page_text or not page_text.strip():
+                    continue
                 
-                for section in sections:
+                # Filter for GLHS-relevant content, but still include general
+                # course/graduation info and skip school-specific sections below
+                if not is_glhs_relevant(page_text) and not _PDF_FALLBACK_RE.search(page_text):
+                    continue
+                relevant_pages += 1
+                
+                # Remove sections of the page that are clearly not GLHS-specific
+                for section in re.split(r'\n{2,}', page_text):
                     if section.strip() and is_glhs_relevant(section):
                         filtered_sections.append(section)
+        
+        if relevant_pages:
+            if filtered_sections:
+                final_text = "\n\n".join(filtered_sections)
                 
-                if filtered_sections:
-                    final_text = "\n\n".join(filtered_sections)
-                    
-                    doc = Document(
-                        page_content=final_text,
-                        metadata={
-                            "source": pdf_file,
-                            "type": "pdf",
-                            "file": pdf_file,
-                            "total_pages": total_pages,
-                            "relevant_pages": relevant_pages
-                        }
-                    )
-                    documents.append(doc)
-                    print(f"✓ Loaded PDF: {pdf_file} ({relevant_pages}/{total_pages} relevant pages)")
-                else:
-                    print(f"⚠ Skipped PDF: {pdf_file} (no GLHS-relevant content found)")
+                doc = Document(
+                    page_content=final_text,
+                    metadata={
+                        "source": pdf_file,
+                        "type": "pdf",
+                        "file": pdf_file,
+                        "total_pages": total_pages,
+                        "relevant_pages": relevant_pages
+                    }
+                )
+                print(f"✓ Loaded PDF: {pdf_file} ({relevant_pages}/{total_pages} relevant pages)")
+                return doc
             else:
-                print(f"⚠ Skipped PDF: {pdf_file} (no extractable text or no relevant content)")
-                
-        except Exception as e:
-            print(f"✗ Error loading PDF {pdf_file}: {e}")
+                print(f"⚠ Skipped PDF: {pdf_file} (no GLHS-relevant content found)")
+        else:
+            print(f"⚠ Skipped PDF: {pdf_file} (no extractable text or no relevant content)")
+            
+    except Exception as e:
+        print(f"✗ Error loading PDF {pdf_file}: {e}")
     
-    return documents
+    return None
 
 
-def build_vector_database():
+def load_pdf_files(pdf_dir: str) -> List[Document]:
+    """Load PDF files from the pdf_docs directory and filter for GLHS-relevant content."""
+    if not PDF_SUPPORT:
+        return []
+    
+    if not os.path.exists(pdf_dir):
+        return []
+    
+    file_paths = [
+        os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')
+    ]
+    if len(file_paths) <= 1:
+        results = [_extract_pdf(path) for path in file_paths]
+    else:
+        # Text extraction is CPU-bound pure Python, so use processes rather than threads
+        with ProcessPoolExecutor(max_workers=min(len(file_paths), os.cpu_count() or 1)) as executor:
+            results = list(executor.map(_extract_pdf, file_paths))
+    
+    return [doc for doc in results if doc is not None]
+
+
+def tag_chunks(chunks: List[Document]):
+    """Record on each chunk what the chatbot needs to know about it, so it never re-scans the text."""
+    for chunk in chunks:
+        metadata = chunk.metadata
+        # What the chunk's source file is about, for routing answers
+        topic = JSON_TOPICS.get(metadata.get("file"), "general")
+        # Other sources count as Wake Tech content when they name it near the start of a chunk
+        if topic == "general" and (
+            "wake_tech" in str(metadata.get("source", "")).lower()
+            or "wake tech" in chunk.page_content[:500].lower()
+        ):
+            topic = "wake_tech"
+        metadata["topic"] = topic
+
+
+def create_batches(threshold: int, measure: Callable[[str], int], coll: List[str],
+                   max_items: int = EMBEDDING_BATCH_MAX_ITEMS) -> List[List[str]]:
+    """
+    Greedily pack items into batches whose measured size stays within threshold.
+    An item larger than threshold on its own still gets a batch to itself.
+    """
+    batches = []
+    current = []
+    current_size = 0
+    
+    for item in coll:
+        size = measure(item)
+        if current and (current_size + size > threshold or len(current) >= max_items):
+            batches.append(current)
+            current = []
+            current_size = 0
+        current.append(item)
+        current_size += size
+    
+    if current:
+        batches.append(current)
+    
+    return batches
+
+
+def batch_texts(texts: List[str]) -> List[List[str]]:
+    """Split texts into token-packed batches sized for one embeddings request each."""
+    encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+    return create_batches(
+        EMBEDDING_BATCH_MAX_TOKENS,
+        lambda text: len(encoding.encode(text, disallowed_special=())),
+        texts
+    )
+
+
+def create_http_client() -> httpx.Client:
+    """HTTP client whose keep-alive pool is sized for the concurrent embedding requests."""
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=EMBEDDING_WORKERS * 2,
+            max_keepalive_connections=EMBEDDING_WORKERS * 2
+        ),
+        timeout=60
+    )
+
+
+class CachedEmbeddings(OpenAIEmbeddings):
+    """
+    OpenAIEmbeddings backed by a SQLite cache keyed by (model, text hash).
+    Survives rebuilds, so only new or changed chunks are sent to the API.
+    """
+    cache_path: str = EMBEDDING_CACHE_PATH
+    
+    def __enter__(self) -> "CachedEmbeddings":
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        """Close the HTTP client the embeddings were created with."""
+        if self.http_client is not None:
+            self.http_client.close()
+    
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A connection per call keeps this safe to use from worker threads.
+        # It commits if the block succeeds and is always closed afterwards.
+        conn = sqlite3.connect(self.cache_path, timeout=30)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "model TEXT, sha256 BLOB, dim INT, vec BLOB, PRIMARY KEY(model, sha256))"
+                )
+                yield conn
+        finally:
+            conn.close()
+    
+    def get_cached(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return the cached vector for each text, or None where there isn't one."""
+        hashes = [hashlib.sha256(text.encode("utf-8")).digest() for text in texts]
+        unique_hashes = list(dict.fromkeys(hashes))
+        found = {}
+        with self._connect() as conn:
+            for start in range(0, len(unique_hashes), EMBEDDING_CACHE_LOOKUP_BATCH):
+                batch = unique_hashes[start:start + EMBEDDING_CACHE_LOOKUP_BATCH]
+                rows = conn.execute(
+                    "SELECT sha256, vec FROM embeddings WHERE model = ? AND dim = ? "
+                    f"AND sha256 IN ({','.join('?' * len(batch))})",
+                    (self.model, EMBEDDING_DIM, *batch)
+                )
+                found.update(rows)
+        return [array("f", found[h]).tolist() if h in found else None for h in hashes]
+    
+    def add_to_cache(self, texts: List[str], vectors: List[List[float]]):
+        """Store freshly computed vectors for later rebuilds."""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, sha256, dim, vec) VALUES (?, ?, ?, ?)",
+                [
+                    (self.model, hashlib.sha256(text.encode("utf-8")).digest(), len(vector),
+                     array("f", vector).tobytes())
+                    for text, vector in zip(texts, vectors)
+                ]
+            )
+    
+    def embed_documents(self, texts: List[str], chunk_size: Optional[int] = 0) -> List[List[float]]:
+        vectors = self.get_cached(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            new_vectors = super().embed_documents([texts[i] for i in missing], chunk_size)
+            self.add_to_cache([texts[i] for i in missing], new_vectors)
+            for i, vector in zip(missing, new_vectors):
+                vectors[i] = vector
+        return vectors
+
+
+def embed_texts(embeddings: OpenAIEmbeddings, texts: List[str]) -> List[List[float]]:
+    """Embed texts using token-packed batches, sending the requests concurrently."""
+    batches = batch_texts(texts)
+    print(f"Embedding {len(texts)} chunks in {len(batches)} request(s)...")
+    
+    # Requests are network-bound, so threads overlap the waits. Rate limit
+    # errors are retried with backoff by the client (max_retries).
+    with ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS) as executor:
+        results = list(executor.map(embeddings.embed_documents, batches))
+    
+    # executor.map preserves batch order, so vectors line up with texts
+    return [vector for batch_vectors in results for vector in batch_vectors]
+
+
+def dedupe_texts(texts: List[str]):
+    """Collapse identical chunk texts, returning the unique texts and each input's index into them."""
+    seen = {}
+    unique_texts = []
+    positions = []
+    for text in texts:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        if digest not in seen:
+            seen[digest] = len(unique_texts)
+            unique_texts.append(text)
+        positions.append(seen[digest])
+    return unique_texts, positions
+
+
+def embed_texts_with_batch_api(texts: List[str]) -> List[List[float]]:
+    """
+    Embed texts through the OpenAI Batch API.
+    Costs half as much as the synchronous endpoint but may take a while to
+    complete, so it is only meant for offline rebuilds.
+    """
+    batches = batch_texts(texts)
+    
+    # Closing the client also closes the HTTP connection pool it was given
+    with create_http_client() as http_client, OpenAI(http_client=http_client) as client:
+        # One request line per token-packed batch
+        lines = [
+            json.dumps({
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/v1/embeddings",
+                "body": {"model": EMBEDDING_MODEL, "input": batch, "dimensions": EMBEDDING_DIM}
+            }, ensure_ascii=False)
+            for i, batch in enumerate(batches)
+        ]
+        input_file = client.files.create(
+            file=("embeddings.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        job = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/embeddings",
+            completion_window="24h"
+        )
+        print(f"Submitted batch {job.id} with {len(batches)} request(s) for {len(texts)} chunks")
+        
+        while job.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(BATCH_API_POLL_SECONDS)
+            job = client.batches.retrieve(job.id)
+            counts = job.request_counts
+            if counts:
+                print(f"  Batch status: {job.status} ({counts.completed}/{counts.total} requests done)")
+            else:
+                print(f"  Batch status: {job.status}")
+        
+        if job.status != "completed" or not job.output_file_id:
+            raise RuntimeError(f"Batch {job.id} finished with status '{job.status}'")
+        
+        output = client.files.content(job.output_file_id).text
+    
+    # Output lines can arrive in any order, so collect them by custom_id
+    results = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        response = row.get("response") or {}
+        if row.get("error") or response.get("status_code") != 200:
+            raise RuntimeError(f"Batch request {row.get('custom_id')} failed: {row.get('error') or response}")
+        data = sorted(response["body"]["data"], key=lambda item: item["index"])
+        results[int(row["custom_id"])] = [item["embedding"] for item in data]
+    
+    if len(results) != len(batches):
+        raise RuntimeError(f"Batch {job.id} returned {len(results)} of {len(batches)} responses")
+    
+    return [vector for i in range(len(batches)) for vector in results[i]]
+
+
+def release_chroma_clients():
+    """
+    Stop the client chromadb keeps open for each persist directory. Otherwise a
+    store opened before a rebuild keeps using the deleted files, and the rebuilt
+    collection can't be read until the process restarts.
+    """
+    from chromadb.api.client import SharedSystemClient
+    SharedSystemClient.clear_system_cache()
+
+
+def build_vector_database(persist_directory: Optional[str] = None, use_batch_api: bool = False):
     """Build the ChromaDB vector database from JSON files."""
-    # Get paths
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    data_dir = os.path.join(base_dir, "data")
-    persist_directory = os.path.join(base_dir, "chroma_db")
+    from langchain_community.vectorstores import Chroma
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    
+    persist_directory = persist_directory or PERSIST_DIRECTORY
     
     print("=" * 60)
     print("Building ChromaDB Vector Database")
@@ -318,22 +853,17 @@ def build_vector_database():
         print("Please create a .env file with: OPENAI_API_KEY=your_key_here")
         return
     
-    # Initialize embeddings
-    print("Initializing embeddings...")
-    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
-    
     # Load documents
     print("\nLoading documents...")
     all_documents = []
     
     # Load JSON files
-    json_docs = load_json_files(data_dir)
+    json_docs = load_json_files(DATA_DIR)
     all_documents.extend(json_docs)
     print(f"Loaded {len(json_docs)} JSON document(s)")
     
     # Load PDF files
-    pdf_dir = os.path.join(data_dir, "pdf_docs")
-    pdf_docs = load_pdf_files(pdf_dir)
+    pdf_docs = load_pdf_files(PDF_DIR)
     all_documents.extend(pdf_docs)
     if pdf_docs:
         print(f"Loaded {len(pdf_docs)} PDF document(s)")
@@ -347,13 +877,21 @@ def build_vector_database():
     
     # Split documents into chunks
     print("\nSplitting documents into chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(
+    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        model_name=EMBEDDING_MODEL,
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
-        length_function=len,
+        separators=CHUNK_SEPARATORS,
     )
     
-    chunks = text_splitter.split_documents(all_documents)
+    # Each document splits independently and tiktoken releases the GIL while encoding
+    with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as executor:
+        chunks = [
+            chunk
+            for document_chunks in executor.map(text_splitter.split_documents, ([doc] for doc in all_documents))
+            for chunk in document_chunks
+        ]
+    tag_chunks(chunks)
     print(f"Created {len(chunks)} chunks")
     
     # Create or update vector store
@@ -363,19 +901,63 @@ def build_vector_database():
     if os.path.exists(persist_directory):
         import shutil
         print(f"Removing existing database at {persist_directory}...")
+        release_chroma_clients()
         shutil.rmtree(persist_directory)
     
-    # Create new vector store
-    vectorstore = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=persist_directory
-    )
+    # Initialize embeddings; closing them releases the HTTP connection pool
+    print("Initializing embeddings...")
+    with CachedEmbeddings(
+        model=EMBEDDING_MODEL,
+        model_kwargs={"dimensions": EMBEDDING_DIM},
+        chunk_size=EMBEDDING_BATCH_MAX_ITEMS,
+        max_retries=6,
+        request_timeout=60,
+        http_client=create_http_client()
+    ) as embeddings:
+        # Embed all chunks up front so requests go out in large batches
+        texts = [chunk.page_content for chunk in chunks]
+        metadatas = [chunk.metadata for chunk in chunks]
+        
+        # Repeated boilerplate only needs to be embedded once
+        unique_texts, positions = dedupe_texts(texts)
+        if len(unique_texts) < len(texts):
+            print(f"Embedding {len(unique_texts)} unique chunks ({len(texts) - len(unique_texts)} duplicates reused)")
+        if use_batch_api:
+            # The Batch API bypasses embed_documents, so consult the cache here
+            unique_vectors = embeddings.get_cached(unique_texts)
+            missing = [i for i, vector in enumerate(unique_vectors) if vector is None]
+            print(f"Reusing {len(unique_texts) - len(missing)} cached embedding(s)")
+            if missing:
+                missing_texts = [unique_texts[i] for i in missing]
+                new_vectors = embed_texts_with_batch_api(missing_texts)
+                embeddings.add_to_cache(missing_texts, new_vectors)
+                for i, vector in zip(missing, new_vectors):
+                    unique_vectors[i] = vector
+        else:
+            unique_vectors = embed_texts(embeddings, unique_texts)
+        vectors = [unique_vectors[i] for i in positions]
+        
+        # Create new vector store from the precomputed embeddings
+        vectorstore = Chroma(
+            collection_name=COLLECTION_NAME,
+            persist_directory=persist_directory,
+            embedding_function=embeddings,
+            collection_metadata=COLLECTION_METADATA
+        )
+        ids = [str(uuid.uuid4()) for _ in texts]
+        for start in range(0, len(texts), CHROMA_ADD_BATCH_SIZE):
+            end = start + CHROMA_ADD_BATCH_SIZE
+            vectorstore._collection.add(
+                ids=ids[start:end],
+                embeddings=vectors[start:end],
+                metadatas=metadatas[start:end],
+                documents=texts[start:end]
+            )
     
     print(f"\n✓ Vector database created successfully!")
     print(f"  Location: {persist_directory}")
     print(f"  Total chunks: {len(chunks)}")
-    print(f"  Embedding model: {EMBEDDING_MODEL}")
+    print(f"  Embedding model: {EMBEDDING_MODEL} ({EMBEDDING_DIM} dimensions)")
     print()
     print("=" * 60)
     print("Database build complete!")
@@ -383,5 +965,12 @@ def build_vector_database():
 
 
 if __name__ == "__main__":
-    build_vector_database()
+    parser = argparse.ArgumentParser(description="Build the ChromaDB vector database.")
+    parser.add_argument(
+        "--batch-api",
+        action="store_true",
+        help="Embed through the OpenAI Batch API (half the cost, can take up to 24h)"
+    )
+    args = parser.parse_args()
+    build_vector_database(use_batch_api=args.batch_api)
 
@@ -4,81 +4,379 @@ Includes greeting detection and scope filtering.
 """
 import os
 import re
-import json
+import logging
 import pathlib
-from typing import List, Dict, Optional
-from langchain_community.vectorstores import Chroma
+import threading
+from collections import OrderedDict
+from functools import cached_property, lru_cache
+from typing import TYPE_CHECKING, Iterator, List, Dict, NamedTuple, Optional, Tuple
+import numpy as np
 from langchain_community.embeddings import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document, SystemMessage, HumanMessage, AIMessage
-from langchain.chat_models import ChatOpenAI
-from utils import load_json_data
+from utils import load_json_data, SESSION_HISTORY_LIMIT
+from build_vector_db import (
+    DATA_DIR, PERSIST_DIRECTORY, EMBEDDING_MODEL, EMBEDDING_DIM, EMBEDDING_METADATA,
+    COLLECTION_NAME, build_vector_database, release_chroma_clients
+)
 
-try:
-    from pypdf import PdfReader
-    PDF_SUPPORT = True
-except ImportError:
-    PDF_SUPPORT = False
+# The chat model and vector store are imported when first used, so the server
+# starts (and classifies greetings) without loading them
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import Chroma
+    from langchain.chat_models import ChatOpenAI
+
+
+logger = logging.getLogger(__name__)
+
+CHAT_MODEL = "gpt-4o-mini"
+RETRIEVAL_K = 3
+# Adjacent chunks repeat up to CHUNK_OVERLAP tokens of each other; shorter matches are left alone
+CONTEXT_MIN_OVERLAP_CHARS = 50
+
+# The classifiers are pure functions of the message, so repeated questions reuse their results
+CLASSIFIER_CACHE_SIZE = 2048
+
+# Retrieved documents are reused for repeated questions, and answers for near-identical ones
+RETRIEVAL_CACHE_SIZE = 256
+RETRIEVAL_SIMILARITY_THRESHOLD = 0.95
+# A near-identical question's answer is only reused when its documents match the
+# ones retrieved now (Jaccard overlap of the chunk texts; with RETRIEVAL_K = 3
+# that means all three chunks, since two shared chunks only give 0.5)
+ANSWER_MIN_EVIDENCE_OVERLAP = 0.7
+
+RAG_ERROR_RESPONSE = (
+    "I encountered an error while processing your question. "
+    "Please try rephrasing your question or ask about something else. "
+    "I'm here to help with Green Level High School topics!"
+)
+
+# Instructions sent with every RAG question
+SYSTEM_PROMPT = (
+    "You are a helpful AI counselor for Green Level High School (GLHS). "
+    "You answer questions related to school, academics, courses, graduation requirements, "
+    "school policies, schedules, clubs, events, counselors, college preparation, and academic planning. "
+    "\n\n"
+    "CRITICAL RESPONSE RULES:\n"
+    "- Focus STRICTLY on the exact question asked. Answer only what is directly necessary.\n"
+    "- Do NOT include background explanations, unrelated details, or information not directly needed.\n"
+    "- Do NOT expand the scope of the question or add context unless explicitly requested.\n"
+    "- If the query is ambiguous, ask a short clarifying question instead of guessing.\n"
+    "- Stay precise, focused, and minimal.\n"
+    "- Use information from the provided context about GLHS when available\n"
+    "- DO NOT solve simple math problems without context (e.g., 'what is 1+1?')\n"
+    "- DO NOT solve homework problems or provide test answers\n"
+    "- DO NOT answer questions about completely unrelated topics (weather, recipes, etc.)\n"
+    "\n"
+    "IMPORTANT: Do NOT add any links to your response. Links will be automatically added by the system based on the question type.\n"
+    "\n"
+    "FORMATTING REQUIREMENTS:\n"
+    "- Format your responses using Markdown for better readability\n"
+    "- Use **bold** for important terms, numbers, and key information (e.g., **22 credits**, **4x4 Block schedule**)\n"
+    "- Use ## for section headers when organizing information (e.g., ## Graduation Requirements)\n"
+    "- Use ### for subsections when needed\n"
+    "- Use bullet points (- or *) for lists of requirements, courses, or steps\n"
+    "- Use numbered lists (1., 2., 3.) for sequential information\n"
+    "- Keep paragraphs concise and well-organized\n"
+    "- Add a clear header at the start of your response summarizing the topic\n"
+    "\n"
+    "Be friendly, professional, and accurate. Provide only what is explicitly relevant and required."
+)
+# Messages are never modified after they are built, so every request shares this one
+_SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+
+
+# Greeting patterns (matched against lowercased text, flexible)
+_GREETING_PATTERNS = (
+    r'\b(hi|hello|hey|greetings|howdy)\b',
+    r'\bwhat\'?s\s+up\b',
+    r'\bhow\s+are\s+you\b',
+    r'\bhow\s+do\s+you\s+do\b',
+    r'\bgood\s+(morning|afternoon|evening|day)\b',
+    r'\bnice\s+to\s+meet\s+you\b',
+    r'\bhey\s+there\b',
+    r'\bhi\s+there\b',
+    r'\bhello\s+there\b',
+)
+
+# Patterns that indicate homework/test questions
+_HOMEWORK_PATTERNS = (
+    r'\bsolve\s+(this|that|the)\s+(problem|equation|question)',
+    r'\bwhat\s+is\s+\d+\s*[+\-*/]\s*\d+',  # Math problems like "what is 1+1"
+    r'\bcalculate\s+', r'\bcompute\s+', r'\bevaluate\s+',
+    r'\banswer\s+(this|that|the)\s+(question|problem)',
+    r'\bhelp\s+me\s+(solve|with|do)\s+(this|my|the)\s+(homework|assignment|problem)',
+    r'\bwhat\s+is\s+the\s+answer\s+to',
+    r'\bhow\s+do\s+i\s+(solve|calculate|find)',
+    r'\bexplain\s+(how|why)\s+to\s+(solve|calculate)',
+    r'\btest\s+(question|answer)', r'\bquiz\s+(question|answer)',
+    r'\bhomework\s+(help|question|problem)',
+    r'\bassignment\s+(help|question|problem)',
+)
+
+# "What is X" questions about general concepts (science, history, math, etc.)
+_GENERAL_KNOWLEDGE_PATTERNS = (
+    r'what\s+is\s+(photosynthesis|gravity|evolution|atoms?|molecules?|cells?|dna|rna)',
+    r'what\s+is\s+(the\s+)?(speed\s+of\s+light|law\s+of|theory\s+of|formula\s+for)',
+    r'what\s+is\s+\d+',  # "what is 5" (likely math)
+    r'what\s+are\s+(atoms?|molecules?|cells?|genes?|proteins?)',
+    r'who\s+(is|was|are|were)\s+',  # "who is/was" (general knowledge)
+    r'when\s+(did|was|were)\s+',  # "when did/was" (history)
+    r'where\s+(is|are|was|were)\s+',  # "where is" (geography)
+)
+
+
+def _compile_any(patterns, flags=0) -> re.Pattern:
+    """Compile a list of patterns into one alternation that matches wherever any of them would."""
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), flags)
+
+
+# Compiled once at import; each category is checked with a single search
+_GREETING_RE = _compile_any(_GREETING_PATTERNS)
+_HOMEWORK_RE = _compile_any(_HOMEWORK_PATTERNS)
+_GENERAL_KNOWLEDGE_RE = _compile_any(_GENERAL_KNOWLEDGE_PATTERNS)
+_ARITHMETIC_RE = re.compile(r'\b\d+\s*[+\-*/×÷]\s*\d+')
+_WHAT_IS_OR_ARE_RE = re.compile(r'\bwhat\s+(?:is|are)\s+')
+_COURSE_LEVEL_RE = re.compile(r'\b(ap|honors?|academic)\s+')
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+
+
+# Expanded school-related keywords - if ANY of these appear, consider it school-related
+_SCHOOL_RELATED_KEYWORDS = (
+    # School context
+    'green level', 'glhs', 'wcpss', 'wake county',
+    'at this school', 'at glhs', 'at green level',
+    'school\'s', 'schools', 'our school', 'the school',
+    'counselor', 'counseling', 'counselors',
+    # Academic terms
+    'course', 'class', 'classes', 'schedule', 'scheduling',
+    'graduation', 'requirement', 'requirements', 'prerequisite', 'prerequisites',
+    'credit', 'credits', 'gpa', 'grade point average', 'transcript', 'diploma',
+    'curriculum', 'semester', 'year', 'freshman', 'sophomore', 'junior', 'senior',
+    'honors', 'ap ', 'advanced placement', 'academic', 'academics',
+    'teacher', 'teachers', 'student', 'students',
+    # School activities
+    'club', 'clubs', 'extracurricular', 'sport', 'sports', 'scholarship',
+    # College/career
+    'college prep', 'college preparation', 'admission', 'application', 'applications',
+    'college', 'university', 'major', 'majors', 'career', 'pathway', 'pathways',
+    # Academic subjects (when used in school context)
+    'math', 'mathematics', 'science', 'english', 'history', 'social studies',
+    'biology', 'chemistry', 'physics', 'world language', 'foreign language',
+    'arts', 'art', 'music', 'pe', 'physical education', 'health',
+    # Planning/guidance
+    'plan my', 'planning', 'what should i take', 'what classes should',
+    'recommend', 'recommendation', 'advice', 'guidance',
+    # Question patterns that suggest school context
+    'what classes', 'which classes', 'what courses', 'which courses',
+    'how do i', 'can i', 'should i take', 'when is', 'where is',
+    'help with school', 'school help'
+)
+
+# Clearly unrelated (non-academic) topics
+_UNRELATED_KEYWORDS = (
+    'weather', 'recipe', 'cooking', 'sports score', 'movie', 'tv show',
+    'celebrity', 'gossip', 'politics', 'religion', 'dating', 'relationship',
+    'shopping', 'restaurant', 'travel', 'vacation', 'game', 'video game',
+    'sports team', 'nfl', 'nba', 'mlb', 'nhl', 'soccer', 'football game',
+    'capital of', 'president of', 'who invented', 'trivia', 'fun fact'
+)
+
+_CLUB_KEYWORDS = (
+    'club', 'clubs', 'extracurricular', 'organization', 'organizations',
+    'student organization', 'student club', 'after school activity',
+    'after-school activity', 'activity club', 'school club'
+)
+
+_WAKE_TECH_KEYWORDS = (
+    'wake tech', 'waketech', 'ccp', 'career and college promise',
+    'college promise', 'dual credit', 'dual enrollment',
+    'wake tech course', 'wake tech class', 'wake tech program',
+    'wake tech pathway', 'wake tech eligibility', 'wake tech ccp'
+)
+
+
+# Phrases that point a Wake Tech question at one of its official pages.
+# Strong eligibility indicators are explicit eligibility questions
+_ELIGIBILITY_STRONG_INDICATORS = (
+    'eligibility for', 'eligible for', 'eligibility requirements',
+    'eligibility criteria', 'eligibility standards', 'eligibility benchmarks',
+    'am i eligible', 'who is eligible', 'eligibility to', 'qualify for ccp',
+    'ccp eligibility', 'pathway eligibility', 'eligibility page'
+)
+# Related to eligibility but less specific
+_ELIGIBILITY_MEDIUM_INDICATORS = (
+    'eligibility', 'eligible', 'qualify', 'qualification',
+    'gpa requirement', 'test score requirement', 'assessment requirement'
+)
+
+_DUAL_CREDIT_INDICATORS = (
+    'dual credit', 'dual enrollment', 'high school credit',
+    'credit toward graduation', 'counts toward high school',
+    'dual credit allowances', 'dual credit chart'
+)
+
+_PROCEDURE_INDICATORS = (
+    'operating procedure', 'operating procedures', 'ccp procedure',
+    'system procedure', 'section 14', 'ncccs procedure'
+)
+
+_CCP_OVERVIEW_INDICATORS = (
+    'what is ccp', 'what is career and college promise',
+    'overview of ccp', 'about ccp', 'ccp program',
+    'wake tech ccp', 'career and college promise program'
+)
+
+
+def _compile_keywords(keywords) -> re.Pattern:
+    """Compile keywords into one alternation that matches if any of them is a substring."""
+    return _compile_any(re.escape(keyword) for keyword in keywords)
+
+
+# Keyword checks are one search each instead of a Python loop over substrings
+_SCHOOL_RELATED_RE = _compile_keywords(_SCHOOL_RELATED_KEYWORDS)
+_UNRELATED_RE = _compile_keywords(_UNRELATED_KEYWORDS)
+_UNRELATED_OVERRIDE_RE = _compile_keywords(['school', 'class', 'course', 'academic', 'glhs', 'green level'])
+_CLUB_RE = _compile_keywords(_CLUB_KEYWORDS)
+_WAKE_TECH_RE = _compile_keywords(_WAKE_TECH_KEYWORDS)
+_HOMEWORK_POLICY_RE = _compile_keywords(['policy', 'schedule', 'due date', 'when is', 'glhs', 'green level', 'school'])
+_MATH_CLASS_CONTEXT_RE = _compile_keywords(['class', 'course', 'glhs', 'green level', 'school', 'math class'])
+_COURSE_QUESTION_RE = _compile_keywords(['class', 'course', ' like', ' at ', 'offered', 'available'])
+_SCHOOL_CONTEXT_RE = _compile_keywords(['glhs', 'green level', 'school', 'counselor', 'requirement'])
+_SUBJECT_RE = _compile_keywords(['math', 'science', 'english', 'history', 'biology', 'chemistry', 'physics'])
+_ACADEMIC_CONTEXT_RE = _compile_keywords(['class', 'course', 'school', 'academic', 'math class', 'glhs', 'green level'])
+
+
+def _dedupe_context(parts: List[str]) -> List[str]:
+    """
+    Drop repeated chunks and trim the text a chunk shares with the end of an
+    earlier one, so overlapping neighbours are only sent to the LLM once.
+    """
+    kept = []
+    for part in parts:
+        if any(part in earlier for earlier in kept):
+            continue
+        head = part[:CONTEXT_MIN_OVERLAP_CHARS]
+        for earlier in kept:
+            if len(head) < CONTEXT_MIN_OVERLAP_CHARS:
+                break
+            start = earlier.find(head)
+            while start != -1:
+                if part.startswith(earlier[start:]):
+                    part = part[len(earlier) - start:].lstrip()
+                    head = part[:CONTEXT_MIN_OVERLAP_CHARS]
+                    break
+                start = earlier.find(head, start + 1)
+        if part:
+            kept.append(part)
+    return kept
+
+
+class WakeTechLink(NamedTuple):
+    """A Wake Tech page to link at the end of an answer."""
+    url: str
+    title: str
 
 
 class GLHSChatbot:
     """Chatbot for Green Level High School with RAG capabilities."""
     
     def __init__(self):
-        """Initialize the chatbot with vector store and LLM."""
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-ada-002")
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
-        
-        # Initialize vector store
-        persist_directory = os.path.join(os.path.dirname(__file__), "chroma_db")
-        
-        # Check if database exists and has data, if not, build it
-        if not self._vector_db_exists(persist_directory):
-            print("Vector database not found. Building from JSON files...")
-            self._build_vector_database(persist_directory)
-        
-        self.vectorstore = Chroma(
-            persist_directory=persist_directory,
-            embedding_function=self.embeddings
+        """
+        Initialize the chatbot. The OpenAI clients, vector store and school data are
+        created on first use, so greetings and out-of-scope questions never wait on them.
+        """
+        self.persist_directory = PERSIST_DIRECTORY
+        self._vectorstore_lock = threading.Lock()
+        # Turned off in processes that must only open a database built elsewhere
+        # (Gunicorn workers, whose master builds it before forking them)
+        self.builds_vector_database = True
+        
+        # Normalized question -> (query embedding, retrieved documents, answer), oldest first.
+        # The answer is only kept for questions asked without conversation history.
+        self._retrieval_cache = OrderedDict()
+        self._retrieval_cache_lock = threading.Lock()
+    
+    @cached_property
+    def embeddings(self) -> OpenAIEmbeddings:
+        # Each chat holds a server thread while it waits on OpenAI, so cap how
+        # long a stalled request can keep one busy
+        return OpenAIEmbeddings(
+            model=EMBEDDING_MODEL,
+            model_kwargs={"dimensions": EMBEDDING_DIM},
+            request_timeout=10,
+            max_retries=2
         )
-        self.retriever = self.vectorstore.as_retriever(search_kwargs={"k": 5})
-        
-        # Load school data for context
-        self.school_data = self._load_school_data()
-        
-        # Greeting patterns (case-insensitive, flexible)
-        self.greeting_patterns = [
-            r'\b(hi|hello|hey|greetings|howdy)\b',
-            r'\bwhat\'?s\s+up\b',
-            r'\bhow\s+are\s+you\b',
-            r'\bhow\s+do\s+you\s+do\b',
-            r'\bgood\s+(morning|afternoon|evening|day)\b',
-            r'\bnice\s+to\s+meet\s+you\b',
-            r'\bhey\s+there\b',
-            r'\bhi\s+there\b',
-            r'\bhello\s+there\b',
-        ]
-        
-        # School-related keywords for scope detection
-        self.school_keywords = [
-            'school', 'academic', 'course', 'class', 'grade', 'gpa', 'credit',
-            'graduation', 'college', 'university', 'counselor', 'schedule',
-            'curriculum', 'requirement', 'prerequisite', 'honors', 'ap', 'academic',
-            'teacher', 'student', 'homework', 'assignment', 'exam', 'test', 'quiz',
-            'semester', 'year', 'freshman', 'sophomore', 'junior', 'senior',
-            'green level', 'glhs', 'wcpss', 'wake county', 'counseling',
-            'major', 'career', 'pathway', 'club', 'extracurricular', 'sport',
-            'scholarship', 'application', 'admission', 'transcript', 'diploma'
+    
+    @cached_property
+    def llm(self) -> "ChatOpenAI":
+        from langchain.chat_models import ChatOpenAI
+        return ChatOpenAI(model=CHAT_MODEL, temperature=0.7, request_timeout=30, max_retries=2)
+    
+    @cached_property
+    def vectorstore(self) -> "Chroma":
+        """Open the vector store, building it first if it is missing or out of date."""
+        # Only one request thread should ever run the build
+        with self._vectorstore_lock:
+            store = self._open_current_vectorstore()
+            if store is None:
+                if not self.builds_vector_database:
+                    raise RuntimeError(
+                        "Vector database not found or out of date. Run: python build_vector_db.py"
+                    )
+                print("Vector database not found or out of date. Building from JSON files...")
+                self._build_vector_database(self.persist_directory)
+                store = self._open_vectorstore()
+        
+        return store
+    
+    def prepare_vector_database(self):
+        """
+        Build the vector database if it is missing or out of date, without keeping
+        it open. Used by a parent process before it forks the workers that serve it.
+        """
+        if self._open_current_vectorstore() is None:
+            print("Vector database not found or out of date. Building from JSON files...")
+            self._build_vector_database(self.persist_directory)
+        # Don't leave a chromadb client behind for forked processes to inherit
+        release_chroma_clients()
+    
+    @cached_property
+    def search_index(self) -> Tuple[np.ndarray, List[Document]]:
+        """
+        Load every stored chunk and its embedding into memory. The corpus is small
+        enough that an exact dot product over all of it is faster than a Chroma query.
+        """
+        stored = self.vectorstore._collection.get(include=["embeddings", "documents", "metadatas"])
+        vectors = np.asarray(stored["embeddings"], dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1.0, norms)
+        docs = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(stored["documents"], stored["metadatas"])
         ]
+        return vectors, docs
+    
+    def warm_up(self):
+        """Open the clients and load the search index now instead of on the first question."""
+        try:
+            self.llm
+            self.search_index
+            self.school_data
+        except Exception as e:
+            print(f"Warning: Chatbot warm-up failed: {e}")
+    
+    @cached_property
+    def school_data(self) -> Dict:
+        """School data used for context and link extraction."""
+        return self._load_school_data()
     
     def _load_school_data(self) -> Dict:
         """Load school data from JSON files."""
-        data_dir = os.path.join(os.path.dirname(__file__), "data")
         school_data = {}
         
         try:
             school_data["glhs_info"] = load_json_data(
-                os.path.join(data_dir, "glhs_info.json")
+                os.path.join(DATA_DIR, "glhs_info.json")
             )
         except Exception as e:
             print(f"Warning: Could not load glhs_info.json: {e}")
@@ -86,7 +384,7 @@ class GLHSChatbot:
         # Load Wake Tech data for link extraction
         try:
             school_data["wake_tech"] = load_json_data(
-                os.path.join(data_dir, "wake_tech.json")
+                os.path.join(DATA_DIR, "wake_tech.json")
             )
         except Exception as e:
             print(f"Warning: Could not load wake_tech.json: {e}")
@@ -94,254 +392,58 @@ class GLHSChatbot:
         
         return school_data
     
-    def _vector_db_exists(self, persist_directory: str) -> bool:
-        """Check if vector database exists and has data."""
-        if not os.path.exists(persist_directory):
-            return False
-        
-        # Check if directory has content
+    def _open_vectorstore(self) -> "Chroma":
+        from langchain_community.vectorstores import Chroma
+        return Chroma(
+            collection_name=COLLECTION_NAME,
+            persist_directory=self.persist_directory,
+            embedding_function=self.embeddings
+        )
+    
+    def _open_current_vectorstore(self) -> Optional["Chroma"]:
+        """Open the vector store if it exists, has data and matches the embedding settings, else None."""
+        if not self._vector_db_files_exist(self.persist_directory):
+            return None
+        store = self._open_vectorstore()
+        # The build stops chromadb's client for this directory before deleting it
+        return store if self._vector_db_is_current(store) else None
+    
+    @staticmethod
+    def _vector_db_files_exist(persist_directory: str) -> bool:
+        """Check on disk, without opening Chroma, whether a vector database was ever written."""
+        path = pathlib.Path(persist_directory)
+        return path.is_dir() and any(path.iterdir())
+    
+    @staticmethod
+    def _vector_db_is_current(store: "Chroma") -> bool:
+        """Check if an opened vector database has data and was built with the current embedding settings."""
         try:
-            path = pathlib.Path(persist_directory)
-            if not any(path.iterdir()):
-                return False
-            
-            # Try to load the collection to verify it has data
-            test_store = Chroma(
-                persist_directory=persist_directory,
-                embedding_function=self.embeddings
-            )
-            # Try to get collection count
-            collection = test_store._collection
+            collection = store._collection
             if collection and collection.count() > 0:
-                return True
+                # Vectors from a different model or dimension can't be compared with our
+                # queries, and a different chunking means the index is out of date
+                metadata = collection.metadata or {}
+                return all(metadata.get(key) == value for key, value in EMBEDDING_METADATA.items())
         except Exception:
             pass
         
         return False
     
-    def _is_glhs_relevant(self, text: str) -> bool:
-        """Filter content to only include GLHS-relevant information."""
-        text_lower = text.lower()
-        
-        # GLHS-specific keywords (positive indicators)
-        glhs_keywords = [
-            "green level", "glhs", "green level high school",
-            "course", "graduation", "credit", "prerequisite", "honors", "ap ",
-            "advanced placement", "gpa", "grade point average", "schedule",
-            "registration", "elective", "required", "math", "science", "english",
-            "social studies", "world language", "arts", "cte", "healthful living",
-            "physical education"
-        ]
-        
-        # School-specific keywords to exclude
-        exclude_keywords = [
-            "apex high school", "cary high school", "garner high school",
-            "holly springs high school", "leesville road high school",
-            "middle creek high school", "panther creek high school",
-            "wakefield high school", "wake forest high school", "enloe high school",
-            "millbrook high school", "sanderson high school", "broughton high school",
-            "athens drive high school", "fuquay-varina high school",
-            "green hope high school", "heritage high school", "hillside high school",
-            "knightdale high school", "rolesville high school", "southeast raleigh",
-            "southeast raleigh high school", "wake early college", "wake stem",
-            "wake young men's", "wake young women's"
-        ]
-        
-        # Check for exclusion keywords first
-        for exclude in exclude_keywords:
-            if exclude in text_lower:
-                return False
-        
-        # Check for GLHS or general keywords
-        for keyword in glhs_keywords:
-            if keyword in text_lower:
-                return True
-        
-        # Include general educational content
-        educational_keywords = [
-            "requirement", "curriculum", "program", "pathway", "endorsement", "diploma"
-        ]
-        
-        for keyword in educational_keywords:
-            if keyword in text_lower:
-                return True
-        
-        return False
-    
-    def _load_pdf_files(self, pdf_dir: str) -> List[Document]:
-        """Load PDF files and filter for GLHS-relevant content."""
-        if not PDF_SUPPORT:
-            return []
-        
-        documents = []
-        
-        if not os.path.exists(pdf_dir):
-            return documents
-        
-        pdf_files = [f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]
-        
-        for pdf_file in pdf_files:
-            file_path = os.path.join(pdf_dir, pdf_file)
-            try:
-                reader = PdfReader(file_path)
-                all_text = []
-                total_pages = len(reader.pages)
-                relevant_pages = 0
-                
-                for page_num, page in enumerate(reader.pages, 1):
-                    try:
-                        page_text = page.extract_text()
-                        if page_text and page_text.strip():
-                            if self._is_glhs_relevant(page_text):
-                                all_text.append(page_text)
-                                relevant_pages += 1
-                            elif any(keyword in page_text.lower() for keyword in 
-                                   ["course", "graduation", "credit", "requirement", 
-                                    "curriculum", "program", "pathway"]):
-                                all_text.append(page_text)
-                                relevant_pages += 1
-                    except Exception:
-                        continue
-                
-                if all_text:
-                    full_text = "\n\n".join(all_text)
-                    sections = re.split(r'\n{2,}', full_text)
-                    filtered_sections = [s for s in sections if s.strip() and self._is_glhs_relevant(s)]
-                    
-                    if filtered_sections:
-                        final_text = "\n\n".join(filtered_sections)
-                        doc = Document(
-                            page_content=final_text,
-                            metadata={"source": pdf_file, "type": "pdf", "file": pdf_file}
-                        )
-                        documents.append(doc)
-            except Exception as e:
-                print(f"Warning: Could not load PDF {pdf_file}: {e}")
-        
-        return documents
-    
     def _build_vector_database(self, persist_directory: str):
         """Build vector database from JSON files and PDFs."""
-        base_dir = os.path.dirname(__file__)
-        data_dir = os.path.join(base_dir, "data")
-        
-        CHUNK_SIZE = 1000
-        CHUNK_OVERLAP = 200
-        
-        all_documents = []
-        
-        # Load JSON files
-        json_files = [
-            "glhs_info.json",
-            "glhs_course_catalog.json",
-            "glhs_graduation_requirments.json",
-            "glhs_clubs.json",
-            "clubs.json",
-            "glhs_college_pathways.json",
-            "glhs_college_filters.json",
-            "academic_difficulty_profile.json",
-            "honors_difficulty_profile.json",
-            "ap_difficulty_profile.json",
-            "majors.ljson",
-            "oppurtunities_database.json",
-            "class_requirements.json",
-            "application_glossary.json",
-            "system_metadata.json",
-            "wcpss_planning_guide_glhs.json",
-            "class_directory.json",
-            "freshman_courses.json",
-            "sophmore_courses.json",
-            "junior_courses.json",
-            "wake_tech.json"
-        ]
-        
-        for json_file in json_files:
-            file_path = os.path.join(data_dir, json_file)
-            if os.path.exists(file_path):
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    
-                    # Special handling for clubs.json to create separate documents per club
-                    if json_file == "clubs.json" and isinstance(data, dict) and "clubs" in data:
-                        # Create a separate document for each club to improve retrieval accuracy
-                        for club in data.get("clubs", []):
-                            # Format club information as readable text
-                            club_text = f"Club Name: {club.get('name', 'N/A')}\n"
-                            club_text += f"Category: {club.get('category', 'N/A')}\n"
-                            if club.get('advisors'):
-                                advisors = club['advisors'] if isinstance(club['advisors'], list) else [club['advisors']]
-                                club_text += f"Advisors: {', '.join(advisors)}\n"
-                            if club.get('student_contacts'):
-                                contacts = club['student_contacts'] if isinstance(club['student_contacts'], list) else [club['student_contacts']]
-                                club_text += f"Student Contacts: {', '.join(contacts)}\n"
-                            if club.get('activities'):
-                                club_text += f"Activities: {club.get('activities')}\n"
-                            if club.get('meeting_day'):
-                                club_text += f"Meeting Day: {club.get('meeting_day')}\n"
-                            if club.get('location'):
-                                club_text += f"Location: {club.get('location')}\n"
-                            
-                            doc = Document(
-                                page_content=club_text,
-                                metadata={
-                                    "source": json_file,
-                                    "type": "json",
-                                    "file": json_file,
-                                    "club_name": club.get('name', ''),
-                                    "category": club.get('category', '')
-                                }
-                            )
-                            all_documents.append(doc)
-                    else:
-                        text_content = json.dumps(data, indent=2, ensure_ascii=False)
-                        doc = Document(
-                            page_content=text_content,
-                            metadata={"source": json_file, "type": "json", "file": json_file}
-                        )
-                        all_documents.append(doc)
-                except Exception as e:
-                    print(f"Warning: Could not load {json_file}: {e}")
-        
-        # Load PDF files
-        pdf_dir = os.path.join(data_dir, "pdf_docs")
-        pdf_docs = self._load_pdf_files(pdf_dir)
-        all_documents.extend(pdf_docs)
-        
-        if not all_documents:
-            print("Warning: No documents found to build vector database!")
-            return
-        
-        # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            length_function=len,
-        )
-        
-        chunks = text_splitter.split_documents(all_documents)
-        
-        # Create vector store
-        if os.path.exists(persist_directory):
-            import shutil
-            shutil.rmtree(persist_directory)
-        
-        Chroma.from_documents(
-            documents=chunks,
-            embedding=self.embeddings,
-            persist_directory=persist_directory
-        )
-        
-        print(f"Vector database built with {len(chunks)} chunks from {len(all_documents)} documents")
+        # Same pipeline as build_vector_db.py: batched, cached embeddings
+        # written straight into the collection
+        build_vector_database(persist_directory)
     
-    def _is_greeting(self, text: str) -> bool:
+    @staticmethod
+    @lru_cache(maxsize=CLASSIFIER_CACHE_SIZE)
+    def _is_greeting(text: str) -> bool:
         """Check if the input is a greeting."""
         text_lower = text.lower().strip()
         
         # Check against greeting patterns
-        for pattern in self.greeting_patterns:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                return True
+        if _GREETING_RE.search(text_lower):
+            return True
         
         # Check for very short messages that are likely greetings
         if len(text_lower.split()) <= 3:
@@ -350,55 +452,6 @@ class GLHSChatbot:
         
         return False
     
-    def _is_school_related(self, text: str) -> bool:
-        """
-        Check if the input is related to school, academics, or education.
-        More permissive: allows any question with academic/school-related keywords.
-        """
-        text_lower = text.lower()
-        
-        # Check if it's a greeting (greetings are always allowed)
-        if self._is_greeting(text):
-            return True
-        
-        # Expanded school-related keywords - if ANY of these appear, consider it school-related
-        school_keywords = [
-            # School context
-            'green level', 'glhs', 'wcpss', 'wake county',
-            'at this school', 'at glhs', 'at green level',
-            'school\'s', 'schools', 'our school', 'the school',
-            'counselor', 'counseling', 'counselors',
-            # Academic terms
-            'course', 'class', 'classes', 'schedule', 'scheduling',
-            'graduation', 'requirement', 'requirements', 'prerequisite', 'prerequisites',
-            'credit', 'credits', 'gpa', 'grade point average', 'transcript', 'diploma',
-            'curriculum', 'semester', 'year', 'freshman', 'sophomore', 'junior', 'senior',
-            'honors', 'ap ', 'advanced placement', 'academic', 'academics',
-            'teacher', 'teachers', 'student', 'students',
-            # School activities
-            'club', 'clubs', 'extracurricular', 'sport', 'sports', 'scholarship',
-            # College/career
-            'college prep', 'college preparation', 'admission', 'application', 'applications',
-            'college', 'university', 'major', 'majors', 'career', 'pathway', 'pathways',
-            # Academic subjects (when used in school context)
-            'math', 'mathematics', 'science', 'english', 'history', 'social studies',
-            'biology', 'chemistry', 'physics', 'world language', 'foreign language',
-            'arts', 'art', 'music', 'pe', 'physical education', 'health',
-            # Planning/guidance
-            'plan my', 'planning', 'what should i take', 'what classes should',
-            'recommend', 'recommendation', 'advice', 'guidance',
-            # Question patterns that suggest school context
-            'what classes', 'which classes', 'what courses', 'which courses',
-            'how do i', 'can i', 'should i take', 'when is', 'where is',
-            'help with school', 'school help'
-        ]
-        
-        # If it contains ANY school-related keyword, it's school-related
-        if any(keyword in text_lower for keyword in school_keywords):
-            return True
-        
-        return False
-    
     def _generate_greeting_response(self, text: str) -> str:
         """Generate a friendly response to greetings."""
         text_lower = text.lower().strip()
@@ -413,118 +466,86 @@ class GLHSChatbot:
         # Default friendly greeting
         return "Hello! I'm the Green Level High School AI counselor. I can help you with questions about courses, graduation requirements, college preparation, scheduling, and academic planning. How can I assist you today?"
     
-    def _is_homework_or_test_question(self, text: str) -> bool:
+    @staticmethod
+    @lru_cache(maxsize=CLASSIFIER_CACHE_SIZE)
+    def _is_homework_or_test_question(text: str) -> bool:
         """Detect if the question is asking for homework/test answers or academic problem solving."""
         text_lower = text.lower()
         
-        # Patterns that indicate homework/test questions
-        homework_patterns = [
-            r'\bsolve\s+(this|that|the)\s+(problem|equation|question)',
-            r'\bwhat\s+is\s+\d+\s*[+\-*/]\s*\d+',  # Math problems like "what is 1+1"
-            r'\bcalculate\s+', r'\bcompute\s+', r'\bevaluate\s+',
-            r'\banswer\s+(this|that|the)\s+(question|problem)',
-            r'\bhelp\s+me\s+(solve|with|do)\s+(this|my|the)\s+(homework|assignment|problem)',
-            r'\bwhat\s+is\s+the\s+answer\s+to',
-            r'\bhow\s+do\s+i\s+(solve|calculate|find)',
-            r'\bexplain\s+(how|why)\s+to\s+(solve|calculate)',
-            r'\btest\s+(question|answer)', r'\bquiz\s+(question|answer)',
-            r'\bhomework\s+(help|question|problem)',
-            r'\bassignment\s+(help|question|problem)',
-        ]
-        
-        for pattern in homework_patterns:
-            if re.search(pattern, text_lower):
-                # But allow if it's about school's homework policies or test schedules
-                if any(kw in text_lower for kw in ['policy', 'schedule', 'due date', 'when is', 'glhs', 'green level', 'school']):
-                    return False
-                return True
+        if _HOMEWORK_RE.search(text_lower):
+            # But allow if it's about school's homework policies or test schedules
+            if _HOMEWORK_POLICY_RE.search(text_lower):
+                return False
+            return True
         
         # Check for math problems (simple arithmetic)
-        if re.search(r'\b\d+\s*[+\-*/×÷]\s*\d+', text_lower):
+        if _ARITHMETIC_RE.search(text_lower):
             # But allow if asking about math classes at school
-            if not any(kw in text_lower for kw in ['class', 'course', 'glhs', 'green level', 'school', 'math class']):
+            if not _MATH_CLASS_CONTEXT_RE.search(text_lower):
                 return True
         
         # Check for general "what is X" questions that aren't about the school
         # But allow questions about school classes (e.g., "what is AP Biology class like?")
-        if re.search(r'\bwhat\s+is\s+', text_lower) or re.search(r'\bwhat\s+are\s+', text_lower):
+        if _WHAT_IS_OR_ARE_RE.search(text_lower):
             # If it mentions "class", "course", "like", "at", it's likely about school
-            if any(kw in text_lower for kw in ['class', 'course', ' like', ' at ', 'offered', 'available']):
+            if _COURSE_QUESTION_RE.search(text_lower):
                 return False
             
             # If it mentions school context, it's about school
-            if any(kw in text_lower for kw in ['glhs', 'green level', 'school', 'counselor', 'requirement']):
+            if _SCHOOL_CONTEXT_RE.search(text_lower):
                 return False
             
             # Check for course/class names (AP, Honors, etc.) - these are likely about school
-            if re.search(r'\b(ap|honors?|academic)\s+', text_lower):
+            if _COURSE_LEVEL_RE.search(text_lower):
                 return False
             
             # Check if it's asking about a general concept (science, history, math, etc.)
             # These are likely general knowledge questions
-            general_knowledge_patterns = [
-                r'what\s+is\s+(photosynthesis|gravity|evolution|atoms?|molecules?|cells?|dna|rna)',
-                r'what\s+is\s+(the\s+)?(speed\s+of\s+light|law\s+of|theory\s+of|formula\s+for)',
-                r'what\s+is\s+\d+',  # "what is 5" (likely math)
-                r'what\s+are\s+(atoms?|molecules?|cells?|genes?|proteins?)',
-                r'who\s+(is|was|are|were)\s+',  # "who is/was" (general knowledge)
-                r'when\s+(did|was|were)\s+',  # "when did/was" (history)
-                r'where\s+(is|are|was|were)\s+',  # "where is" (geography)
-            ]
-            
-            for pattern in general_knowledge_patterns:
-                if re.search(pattern, text_lower):
-                    return True
+            if _GENERAL_KNOWLEDGE_RE.search(text_lower):
+                return True
             
             # Very short "what is X" questions without school context are likely general knowledge
             # But if it contains course-related terms, it might be about school
             if len(text_lower.split()) <= 5:
                 # Check if it might be a course name
-                if not any(kw in text_lower for kw in ['math', 'science', 'english', 'history', 'biology', 'chemistry', 'physics']):
+                if not _SUBJECT_RE.search(text_lower):
                     return True
         
         return False
     
-    def _is_outside_scope(self, text: str) -> bool:
+    @staticmethod
+    @lru_cache(maxsize=CLASSIFIER_CACHE_SIZE)
+    def _is_outside_scope(text: str) -> bool:
         """
         Determine if the question is completely outside the scope of school/academics.
         Only blocks: clearly unrelated topics (weather, recipes, etc.) and simple math problems without context.
         """
         # If it's a greeting, it's not outside scope
-        if self._is_greeting(text):
-            return False
-        
-        # If it's school-related, it's not outside scope
-        if self._is_school_related(text):
+        if GLHSChatbot._is_greeting(text):
             return False
         
         text_lower = text.lower()
         
+        # If it contains ANY school-related keyword, it's not outside scope
+        if _SCHOOL_RELATED_RE.search(text_lower):
+            return False
+        
         # Check for simple math problems without any school context (e.g., "what's 1+1")
         # This is the main thing we want to block
-        if re.search(r'\bwhat\s+is\s+\d+\s*[+\-*/]\s*\d+', text_lower) or \
-           re.search(r'\b\d+\s*[+\-*/×÷]\s*\d+', text_lower):
+        # ("what is 1+1" is covered by the bare arithmetic pattern)
+        if _ARITHMETIC_RE.search(text_lower):
             # Only block if there's NO school/academic context
-            if not any(kw in text_lower for kw in ['class', 'course', 'school', 'academic', 'math class', 'glhs', 'green level']):
+            if not _ACADEMIC_CONTEXT_RE.search(text_lower):
                 return True
         
         # Check for clearly unrelated topics (non-academic)
-        unrelated_keywords = [
-            'weather', 'recipe', 'cooking', 'sports score', 'movie', 'tv show',
-            'celebrity', 'gossip', 'politics', 'religion', 'dating', 'relationship',
-            'shopping', 'restaurant', 'travel', 'vacation', 'game', 'video game',
-            'sports team', 'nfl', 'nba', 'mlb', 'nhl', 'soccer', 'football game',
-            'capital of', 'president of', 'who invented', 'trivia', 'fun fact'
-        ]
-        
-        for keyword in unrelated_keywords:
-            if keyword in text_lower:
-                # Only block if it's clearly not school-related
-                if not any(school_kw in text_lower for school_kw in ['school', 'class', 'course', 'academic', 'glhs', 'green level']):
-                    return True
+        if _UNRELATED_RE.search(text_lower):
+            # Only block if it's clearly not school-related
+            if not _UNRELATED_OVERRIDE_RE.search(text_lower):
+                return True
         
         # Check for homework/test question patterns (solving problems)
-        if self._is_homework_or_test_question(text):
+        if GLHSChatbot._is_homework_or_test_question(text):
             return True
         
         # Default: give benefit of the doubt - if we're not sure, let RAG try to answer
@@ -545,34 +566,42 @@ class GLHSChatbot:
         
         return messages
     
-    def _is_club_question(self, question: str) -> bool:
+    @staticmethod
+    @lru_cache(maxsize=CLASSIFIER_CACHE_SIZE)
+    def _is_club_question(question: str) -> bool:
         """Check if the question is about clubs or extracurricular activities."""
         question_lower = question.lower()
-        club_keywords = [
-            'club', 'clubs', 'extracurricular', 'organization', 'organizations',
-            'student organization', 'student club', 'after school activity',
-            'after-school activity', 'activity club', 'school club'
-        ]
-        return any(keyword in question_lower for keyword in club_keywords)
+        return bool(_CLUB_RE.search(question_lower))
     
-    def _is_wake_tech_question(self, question: str) -> bool:
+    @staticmethod
+    @lru_cache(maxsize=CLASSIFIER_CACHE_SIZE)
+    def _is_wake_tech_question(question: str) -> bool:
         """Check if the question is about Wake Tech or CCP."""
         question_lower = question.lower()
-        wake_tech_keywords = [
-            'wake tech', 'waketech', 'ccp', 'career and college promise',
-            'college promise', 'dual credit', 'dual enrollment',
-            'wake tech course', 'wake tech class', 'wake tech program',
-            'wake tech pathway', 'wake tech eligibility', 'wake tech ccp'
-        ]
-        return any(keyword in question_lower for keyword in wake_tech_keywords)
+        return bool(_WAKE_TECH_RE.search(question_lower))
+    
+    def _link_for_answer(self, question: str, context: str, docs: List[Document]) -> Optional[str]:
+        """Return the link text to append to an answer, or None if it doesn't get one."""
+        # Links follow the question type. A Wake Tech link also needs a retrieved
+        # Wake Tech document and a strong match against one of its pages.
+        if self._is_club_question(question):
+            return "\n\nFor more information, check out the [Club Directory](https://docs.google.com/spreadsheets/d/1PRDlRHqqCjqDjnAtC4XkFNGdr1zU1wYkAQV00n65-Ag/edit?gid=0#gid=0)."
+        
+        if self._is_wake_tech_question(question):
+            # Add relevant Wake Tech link only if there's a strong match
+            wake_tech_link_info = self._get_wake_tech_link(question, context, docs)
+            if wake_tech_link_info:
+                return f"\n\nFor more information, check out: [{wake_tech_link_info.title}]({wake_tech_link_info.url})"
+        
+        return None
     
-    def _get_wake_tech_link(self, question: str, context: str = "", retrieved_docs: List[Document] = None) -> Optional[Dict[str, str]]:
+    def _get_wake_tech_link(self, question: str, context: str = "", retrieved_docs: List[Document] = None) -> Optional[WakeTechLink]:
         """Find the most relevant Wake Tech link based on the question and context.
         
         Only returns a link if there's a strong, specific match. No default fallback.
         
         Returns:
-            Dict with 'url' and 'title' keys, or None if no strong match found.
+            WakeTechLink with the page's url and title, or None if no strong match found.
         """
         try:
             if not self.school_data.get("wake_tech") or not self.school_data["wake_tech"].get("official_pages"):
@@ -581,19 +610,8 @@ class GLHSChatbot:
             # Check if wake_tech.json was actually retrieved in the context
             # If not, don't show a link (question might not be about Wake Tech)
             if retrieved_docs:
-                wake_tech_in_context = False
-                for doc in retrieved_docs:
-                    try:
-                        metadata = doc.metadata if hasattr(doc, 'metadata') and doc.metadata else {}
-                        page_content = doc.page_content if hasattr(doc, 'page_content') else ""
-                        
-                        if (metadata.get('file') == 'wake_tech.json' or 
-                            'wake_tech' in str(metadata.get('source', '')).lower() or
-                            (page_content and 'wake tech' in str(page_content).lower()[:500])):
-                            wake_tech_in_context = True
-                            break
-                    except Exception:
-                        continue
+                # Chunks are tagged with their source file's topic when the database is built
+                wake_tech_in_context = any(doc.metadata.get("topic") == "wake_tech" for doc in retrieved_docs)
                 
                 if not wake_tech_in_context:
                     return None
@@ -614,21 +632,8 @@ class GLHSChatbot:
                 
                 # Eligibility page - very specific keywords required
                 if page_key == 'eligibility_page':
-                    # Strong indicators: explicit eligibility questions
-                    strong_indicators = [
-                        'eligibility for', 'eligible for', 'eligibility requirements',
-                        'eligibility criteria', 'eligibility standards', 'eligibility benchmarks',
-                        'am i eligible', 'who is eligible', 'eligibility to', 'qualify for ccp',
-                        'ccp eligibility', 'pathway eligibility', 'eligibility page'
-                    ]
-                    # Medium indicators: related but less specific
-                    medium_indicators = [
-                        'eligibility', 'eligible', 'qualify', 'qualification', 
-                        'gpa requirement', 'test score requirement', 'assessment requirement'
-                    ]
-                    
-                    strong_matches = sum(1 for indicator in strong_indicators if indicator in combined_text)
-                    medium_matches = sum(1 for indicator in medium_indicators if indicator in combined_text)
+                    strong_matches = sum(1 for indicator in _ELIGIBILITY_STRONG_INDICATORS if indicator in combined_text)
+                    medium_matches = sum(1 for indicator in _ELIGIBILITY_MEDIUM_INDICATORS if indicator in combined_text)
                     
                     if strong_matches > 0:
                         score = 20 + (strong_matches * 5)  # High score for strong matches
@@ -644,35 +649,21 @@ class GLHSChatbot:
                 
                 # Dual credit page - very specific about dual credit/dual enrollment
                 elif page_key == 'ncdpi_dual_credit':
-                    dual_credit_indicators = [
-                        'dual credit', 'dual enrollment', 'high school credit',
-                        'credit toward graduation', 'counts toward high school',
-                        'dual credit allowances', 'dual credit chart'
-                    ]
-                    matches = sum(1 for indicator in dual_credit_indicators if indicator in combined_text)
+                    matches = sum(1 for indicator in _DUAL_CREDIT_INDICATORS if indicator in combined_text)
                     if matches > 0:
                         score = 15 + (matches * 3)
                 
                 # Operating procedures - very specific about procedures/policies
                 elif page_key == 'ncccs_operating_procedures':
-                    procedure_indicators = [
-                        'operating procedure', 'operating procedures', 'ccp procedure',
-                        'system procedure', 'section 14', 'ncccs procedure'
-                    ]
-                    matches = sum(1 for indicator in procedure_indicators if indicator in combined_text)
+                    matches = sum(1 for indicator in _PROCEDURE_INDICATORS if indicator in combined_text)
                     if matches > 0:
                         score = 15 + (matches * 3)
                 
                 # Main CCP page - only for very general Wake Tech/CCP overview questions
                 elif page_key == 'main_ccp_page':
                     # Only match if it's a general overview question AND no other page matched
-                    general_indicators = [
-                        'what is ccp', 'what is career and college promise',
-                        'overview of ccp', 'about ccp', 'ccp program',
-                        'wake tech ccp', 'career and college promise program'
-                    ]
-                    matches = sum(1 for indicator in general_indicators if indicator in combined_text)
-                    if matches > 0 and not any('eligibility' in combined_text or 'faq' in combined_text or 'dual credit' in combined_text):
+                    matches = sum(1 for indicator in _CCP_OVERVIEW_INDICATORS if indicator in combined_text)
+                    if matches > 0 and not ('eligibility' in combined_text or 'faq' in combined_text or 'dual credit' in combined_text):
                         score = 10
                 
                 page_scores[page_key] = score
@@ -686,19 +677,91 @@ class GLHSChatbot:
                 if best_score >= 10:
                     page = official_pages.get(best_page_key)
                     if page and page.get('url'):
-                        return {
-                            'url': page.get('url'),
-                            'title': page.get('title', 'Wake Tech CCP')
-                        }
+                        return WakeTechLink(page['url'], page.get('title', 'Wake Tech CCP'))
             
             # No strong match found - return None (no link)
             return None
             
-        except Exception as e:
+        except Exception:
             # Log the error but don't crash - just return None (no link)
-            print(f"Error in _get_wake_tech_link: {e}")
+            logger.exception("Error in _get_wake_tech_link")
             return None
     
+    def _search(self, query_vector: np.ndarray) -> List[Document]:
+        """Return the RETRIEVAL_K stored chunks closest to a normalized query embedding."""
+        vectors, docs = self.search_index
+        if not docs:
+            return []
+        similarities = vectors @ query_vector
+        k = min(RETRIEVAL_K, len(docs))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [docs[i] for i in top]
+    
+    @staticmethod
+    def _evidence_overlap(docs: List[Document], other_docs: List[Document]) -> float:
+        """Return the Jaccard overlap between the chunk texts of two retrievals."""
+        texts = {doc.page_content for doc in docs}
+        other_texts = {doc.page_content for doc in other_docs}
+        if not texts and not other_texts:
+            return 1.0
+        return len(texts & other_texts) / len(texts | other_texts)
+    
+    @staticmethod
+    def _retrieval_cache_key(question: str) -> str:
+        return " ".join(_PUNCTUATION_RE.sub(" ", question.lower()).split())
+    
+    def _retrieve_documents(self, question: str) -> Tuple[List[Document], Optional[str]]:
+        """
+        Retrieve documents for a question, reusing the results of an identical
+        recent question instead of searching again.
+        
+        A near-identical question is searched for again, and its earlier answer is
+        only offered when that search found mostly the same documents.
+        
+        Returns:
+            The documents, and the answer given to that earlier question when it
+            was asked without conversation history (None if there isn't one)
+        """
+        key = self._retrieval_cache_key(question)
+        with self._retrieval_cache_lock:
+            if key in self._retrieval_cache:
+                self._retrieval_cache.move_to_end(key)
+                _, docs, answer = self._retrieval_cache[key]
+                return docs, answer
+        
+        query_vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector) or 1.0
+        
+        # Search with the embedding we already have rather than embedding the question again
+        docs = self._search(query_vector)
+        
+        answer = None
+        with self._retrieval_cache_lock:
+            entries = [entry for entry in self._retrieval_cache.values() if entry[2] is not None]
+            if entries:
+                similarities = np.stack([entry[0] for entry in entries]) @ query_vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= RETRIEVAL_SIMILARITY_THRESHOLD:
+                    _, similar_docs, similar_answer = entries[best]
+                    if self._evidence_overlap(docs, similar_docs) >= ANSWER_MIN_EVIDENCE_OVERLAP:
+                        answer = similar_answer
+        
+        with self._retrieval_cache_lock:
+            self._retrieval_cache[key] = (query_vector, docs, answer)
+            self._retrieval_cache.move_to_end(key)
+            while len(self._retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+                self._retrieval_cache.popitem(last=False)
+        return docs, answer
+    
+    def _remember_answer(self, question: str, answer: str):
+        """Attach an answer to the question's retrieval cache entry, for similar questions to reuse."""
+        key = self._retrieval_cache_key(question)
+        with self._retrieval_cache_lock:
+            entry = self._retrieval_cache.get(key)
+            if entry is not None:
+                self._retrieval_cache[key] = (entry[0], entry[1], answer)
+    
     def query_with_rag(
         self,
         question: str,
@@ -714,137 +777,127 @@ class GLHSChatbot:
         Returns:
             Response string
         """
+        return "".join(self.query_with_rag_stream(question, conversation_history))
+    
+    def query_with_rag_stream(
+        self,
+        question: str,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> Iterator[str]:
+        """
+        Same as query_with_rag, but yields the response in pieces as the LLM generates it.
+        
+        Args:
+            question: User's question
+            conversation_history: List of previous messages in format [{"role": "user/assistant", "content": "..."}]
+        
+        Yields:
+            Consecutive pieces of the response string
+        """
         question = question.strip()
         
         if not question:
-            return "I'm here to help! Please ask me a question about Green Level High School."
+            yield "I'm here to help! Please ask me a question about Green Level High School."
+            return
         
         # Handle greetings
         if self._is_greeting(question):
-            return self._generate_greeting_response(question)
+            yield self._generate_greeting_response(question)
+            return
         
         # Check if outside scope (only for clearly unrelated topics)
         if self._is_outside_scope(question):
-            return (
+            yield (
                 "I'm designed to help with questions about Green Level High School, including "
                 "courses, graduation requirements, college preparation, scheduling, and academic planning. "
                 "I'm not able to answer questions outside of these topics. "
                 "Is there something school-related I can help you with instead?"
             )
+            return
         
         # For school-related queries, use RAG
+        streamed_any = False
+        # Answers that don't depend on earlier messages can be reused for similar questions
+        reuse_answer = not conversation_history
+        answer_parts = []
         try:
             # Retrieve relevant documents
-            docs = self.retriever.get_relevant_documents(question)
+            docs, cached_answer = self._retrieve_documents(question)
+            if reuse_answer and cached_answer is not None:
+                yield cached_answer
+                return
             
             # Build context from retrieved documents
-            context_parts = []
-            if docs:
-                for doc in docs:
-                    try:
-                        if hasattr(doc, 'page_content') and doc.page_content:
-                            context_parts.append(str(doc.page_content))
-                    except Exception:
-                        continue
-            context = "\n\n".join(context_parts)
+            context_parts = [doc.page_content for doc in docs if doc.page_content]
+            context = "\n\n".join(_dedupe_context(context_parts))
             
             # If no context retrieved, still proceed but LLM will handle it gracefully
             # Format conversation history
             history_messages = []
             if conversation_history:
-                # Only include recent history (last 6 messages to avoid token limits)
+                # Only include recent history (last 6 messages to avoid token limits;
+                # sessions already keep no more than that)
                 # Exclude the last message if it's the same as the current question (prevent duplication)
-                recent_history = conversation_history[-6:]
+                recent_history = list(conversation_history)[-SESSION_HISTORY_LIMIT:]
+                # question was stripped on entry
                 if (recent_history and 
                     recent_history[-1].get("role") == "user" and 
-                    recent_history[-1].get("content", "").strip().lower() == question.strip().lower()):
-                    recent_history = recent_history[:-1]  # Remove duplicate
+                    recent_history[-1].get("content", "").strip().lower() == question.lower()):
+                    recent_history.pop()  # Remove duplicate
                 history_messages = self._format_conversation_history(recent_history)
             
-            # Build system message
-            system_content = (
-                "You are a helpful AI counselor for Green Level High School (GLHS). "
-                "You answer questions related to school, academics, courses, graduation requirements, "
-                "school policies, schedules, clubs, events, counselors, college preparation, and academic planning. "
-                "\n\n"
-                "CRITICAL RESPONSE RULES:\n"
-                "- Focus STRICTLY on the exact question asked. Answer only what is directly necessary.\n"
-                "- Do NOT include background explanations, unrelated details, or information not directly needed.\n"
-                "- Do NOT expand the scope of the question or add context unless explicitly requested.\n"
-                "- If the query is ambiguous, ask a short clarifying question instead of guessing.\n"
-                "- Stay precise, focused, and minimal.\n"
-                "- Use information from the provided context about GLHS when available\n"
-                "- DO NOT solve simple math problems without context (e.g., 'what is 1+1?')\n"
-                "- DO NOT solve homework problems or provide test answers\n"
-                "- DO NOT answer questions about completely unrelated topics (weather, recipes, etc.)\n"
-                "\n"
-                "IMPORTANT: Do NOT add any links to your response. Links will be automatically added by the system based on the question type.\n"
-                "\n"
-                "FORMATTING REQUIREMENTS:\n"
-                "- Format your responses using Markdown for better readability\n"
-                "- Use **bold** for important terms, numbers, and key information (e.g., **22 credits**, **4x4 Block schedule**)\n"
-                "- Use ## for section headers when organizing information (e.g., ## Graduation Requirements)\n"
-                "- Use ### for subsections when needed\n"
-                "- Use bullet points (- or *) for lists of requirements, courses, or steps\n"
-                "- Use numbered lists (1., 2., 3.) for sequential information\n"
-                "- Keep paragraphs concise and well-organized\n"
-                "- Add a clear header at the start of your response summarizing the topic\n"
-                "\n"
-                "Be friendly, professional, and accurate. Provide only what is explicitly relevant and required."
-            )
-            
             # Build user prompt with context
-            user_prompt = f"Context from school documents:\n{context}\n\n"
-            user_prompt += f"Question: {question}\n\n"
-            user_prompt += "Please provide a helpful answer based on the context above."
+            user_prompt = (
+                f"Context from school documents:\n{context}\n\n"
+                f"Question: {question}\n\n"
+                "Please provide a helpful answer based on the context above."
+            )
             
             # Create messages
-            messages = [SystemMessage(content=system_content)]
+            messages = [_SYSTEM_MESSAGE]
             messages.extend(history_messages)
             messages.append(HumanMessage(content=user_prompt))
             
-            # Generate response
-            # For langchain 0.3.x, use __call__ method
-            response = self.llm(messages)
-            response_text = response.content.strip()
+            # The link only depends on the question and retrieved documents, so
+            # decide it before the LLM call and send it as soon as the answer ends
+            link_text = self._link_for_answer(question, context, docs)
             
-            # Determine if we need to add a link based on question type
-            is_club = self._is_club_question(question)
-            is_wake_tech = self._is_wake_tech_question(question)
+            # Generate response, passing tokens on as they arrive. Whitespace is
+            # held back until more text follows, so the result is stripped the
+            # same way as a complete response would be.
+            pending_whitespace = ""
+            for chunk in self.llm.stream(messages):
+                text = chunk.content
+                if not streamed_any:
+                    text = text.lstrip()
+                stripped = text.rstrip()
+                if stripped:
+                    answer_parts.append(pending_whitespace + stripped)
+                    yield answer_parts[-1]
+                    streamed_any = True
+                    pending_whitespace = text[len(stripped):]
+                else:
+                    pending_whitespace += text
             
-            # Add appropriate link
-            if is_club:
-                # Only add club link for club questions
-                response_text += "\n\nFor more information, check out the [Club Directory](https://docs.google.com/spreadsheets/d/1PRDlRHqqCjqDjnAtC4XkFNGdr1zU1wYkAQV00n65-Ag/edit?gid=0#gid=0)."
-            elif is_wake_tech:
-                # Add relevant Wake Tech link only if there's a strong match
-                wake_tech_link_info = self._get_wake_tech_link(question, context, docs)
-                if wake_tech_link_info:
-                    link_title = wake_tech_link_info.get('title', 'Wake Tech CCP')
-                    link_url = wake_tech_link_info.get('url', '')
-                    response_text += f"\n\nFor more information, check out: [{link_title}]({link_url})"
+            if link_text:
+                answer_parts.append(link_text)
+                yield link_text
             
-            return response_text
+            if reuse_answer:
+                self._remember_answer(question, "".join(answer_parts))
             
-        except Exception as e:
-            import traceback
-            error_traceback = traceback.format_exc()
-            print(f"Error in RAG query: {e}")
-            print(f"Full traceback:\n{error_traceback}")
-            return (
-                "I encountered an error while processing your question. "
-                "Please try rephrasing your question or ask about something else. "
-                "I'm here to help with Green Level High School topics!"
-            )
+        except Exception:
+            logger.exception("Error in RAG query")
+            # Part of an answer may already have been sent
+            yield ("\n\n" + RAG_ERROR_RESPONSE) if streamed_any else RAG_ERROR_RESPONSE
 
 
-# Singleton instance
-_chatbot_instance = None
+# Singleton instance. Creating it only sets up empty caches and locks (everything
+# expensive is loaded on first use), so it is created at import and concurrent
+# first requests can never race to build two.
+_chatbot_instance = GLHSChatbot()
 
 
 def get_chatbot() -> GLHSChatbot:
-    """Get or create the chatbot singleton instance."""
-    global _chatbot_instance
-    if _chatbot_instance is None:
-        _chatbot_instance = GLHSChatbot()
+    """Get the chatbot singleton instance."""
     return _chatbot_instance
@@ -0,0 +1,27 @@
+"""
+Gunicorn settings, read automatically when gunicorn is started from this directory.
+"""
+import threading
+
+
+def on_starting(server):
+    """Build the vector database once in the master, before any worker is forked.
+
+    Workers share the persist directory, so letting each of them rebuild a stale
+    database would have them deleting each other's half-written files.
+    """
+    from chatbot import GLHSChatbot
+    GLHSChatbot().prepare_vector_database()
+
+
+def post_fork(server, worker):
+    """Warm up each worker's chatbot in the background, like app.py does under waitress.
+
+    The OpenAI clients and the Chroma connection aren't safe to share across a
+    fork, so they are opened in every worker rather than in the master.
+    """
+    from app import chatbot
+    if chatbot is not None:
+        # The master already built the database; workers only open it
+        chatbot.builds_vector_database = False
+        threading.Thread(target=chatbot.warm_up, daemon=True).start()
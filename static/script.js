@@ -13,6 +13,10 @@ const sendButton = document.getElementById('sendButton');
 const typingIndicator = document.getElementById('typingIndicator');
 const quickButtons = document.querySelectorAll('.quick-btn');
 
+// Sent by /chat/stream in place of further text when an answer fails partway
+// (STREAM_ERROR_MARKER in app.py)
+const STREAM_ERROR_MARKER = '\u0000';
+
 // Remove welcome message on first interaction
 let welcomeRemoved = false;
 
@@ -141,6 +145,8 @@ function addMessage(text, isUser = false) {
     
     // Auto-scroll to bottom
     chatContainer.scrollTop = chatContainer.scrollHeight;
+    
+    return bubble;
 }
 
 // Show typing indicator
@@ -167,7 +173,7 @@ async function sendMessage(message) {
     sendButton.disabled = true;
 
     try {
-        const response = await fetch('/chat', {
+        const response = await fetch('/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -178,12 +184,55 @@ async function sendMessage(message) {
             })
         });
 
-        const data = await response.json();
-
         if (response.ok) {
+            // Render the answer as it streams in
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let text = '';
+            let bubble = null;
+            const render = () => {
+                if (!text) return;
+                if (!bubble) {
+                    hideTyping();
+                    bubble = addMessage(text, false);
+                } else {
+                    bubble.innerHTML = markdownToHtml(text);
+                    chatContainer.scrollTop = chatContainer.scrollHeight;
+                }
+            };
+            // The server ends a failed answer with the error marker; keep
+            // whatever arrived before it and show the error state after it
+            let failed = false;
+            const checkForError = () => {
+                const errorAt = text.indexOf(STREAM_ERROR_MARKER);
+                if (errorAt !== -1) {
+                    failed = true;
+                    text = text.slice(0, errorAt);
+                }
+            };
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                text += decoder.decode(value, { stream: true });
+                checkForError();
+                render();
+                if (failed) {
+                    reader.cancel();
+                    break;
+                }
+            }
+            if (!failed) {
+                // Flush a multi-byte character split across the last chunk boundary
+                text += decoder.decode();
+                checkForError();
+                render();
+            }
             hideTyping();
-            addMessage(data.response, false);
+            if (failed || !bubble) {
+                addMessage('Sorry, I encountered an error. Please try again.', false);
+            }
         } else {
+            const data = await response.json();
             hideTyping();
             addMessage('Sorry, I encountered an error. Please try again.', false);
             console.error('Error:', data.error);
@@ -0,0 +1,64 @@
+"""
+Tests for the /chat/stream endpoint. The chatbot module is replaced with a fake
+so the tests need neither OpenAI nor a vector database.
+"""
+import sys
+import types
+import unittest
+
+
+class FakeChatbot:
+    """Streams a fixed answer, or fails partway through when asked to."""
+    
+    def query_with_rag_stream(self, question, conversation_history=None):
+        yield "Green Level "
+        if question == "fail":
+            raise RuntimeError("LLM unavailable")
+        yield "answer"
+
+
+def setUpModule():
+    global app_module
+    fake_chatbot = types.ModuleType("chatbot")
+    fake_chatbot.CHAT_MODEL = "test-model"
+    fake_chatbot.RAG_ERROR_RESPONSE = "error response"
+    fake_chatbot.get_chatbot = FakeChatbot
+    sys.modules["chatbot"] = fake_chatbot
+    import app as app_module
+
+
+def tearDownModule():
+    sys.modules.pop("chatbot", None)
+    sys.modules.pop("app", None)
+
+
+class ChatStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.client = app_module.app.test_client()
+    
+    def test_streams_answer_and_records_history(self):
+        response = self.client.post("/chat/stream", json={"message": "hello there", "session_id": "stream-ok"})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(as_text=True), "Green Level answer")
+        history = list(app_module.get_or_create_session("stream-ok"))
+        self.assertEqual([m["role"] for m in history], ["user", "assistant"])
+        self.assertEqual(history[1]["content"], "Green Level answer")
+    
+    def test_failure_ends_stream_with_error_marker(self):
+        response = self.client.post("/chat/stream", json={"message": "fail", "session_id": "stream-fail"})
+        
+        body = response.get_data(as_text=True)
+        self.assertTrue(body.endswith(app_module.STREAM_ERROR_MARKER))
+        self.assertEqual(body[:-len(app_module.STREAM_ERROR_MARKER)], "Green Level ")
+        # A failed answer isn't added to the conversation
+        self.assertEqual(list(app_module.get_or_create_session("stream-fail")), [])
+    
+    def test_empty_message_is_rejected(self):
+        response = self.client.post("/chat/stream", json={"message": "  ", "session_id": "stream-empty"})
+        
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
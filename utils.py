@@ -1,22 +1,68 @@
 """
 Utility functions for session management and JSON loading.
 """
+from collections import OrderedDict, deque
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Deque, Dict, Optional
 import json
 import os
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+try:
+    import redis
+    REDIS_SUPPORT = True
+except ImportError:
+    REDIS_SUPPORT = False
+
+try:
+    import orjson
+    ORJSON_SUPPORT = True
+except ImportError:
+    ORJSON_SUPPORT = False
 
 ##############################################################################
 # Session Memory
 ##############################################################################
+SESSION_TIMEOUT_MINUTES = 5
+# The chatbot only ever reads the most recent messages, so that's all a session keeps
+SESSION_HISTORY_LIMIT = 6
 SESSION_MEMORY: Dict[str, Dict] = {}
 
+# Stale sessions are swept at most this often, from whichever request
+# touches the session map next
+SESSION_SWEEP_INTERVAL_SECONDS = 300
+_last_sweep = time.monotonic()
+
+# Sessions live in Redis when REDIS_URL is set, so every server process
+# shares them and Redis expires idle ones itself
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL and not REDIS_SUPPORT:
+    print("Warning: REDIS_URL is set but redis is not installed. Using in-memory sessions.")
+REDIS_CLIENT = redis.Redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL and REDIS_SUPPORT else None
+
+
+def _session_key(session_id: str) -> str:
+    return f"session:{session_id}"
+
 
-def get_or_create_session(session_id: str) -> List[Dict[str, str]]:
+def get_or_create_session(session_id: str) -> Deque[Dict[str, str]]:
     """Get existing session or create new one."""
+    if REDIS_CLIENT is not None:
+        key = _session_key(session_id)
+        pipe = REDIS_CLIENT.pipeline()
+        pipe.lrange(key, -SESSION_HISTORY_LIMIT, -1)
+        pipe.expire(key, SESSION_TIMEOUT_MINUTES * 60)
+        messages, _ = pipe.execute()
+        return deque((json.loads(message) for message in messages), maxlen=SESSION_HISTORY_LIMIT)
+    
+    _maybe_clear_stale_sessions()
     if session_id not in SESSION_MEMORY:
         SESSION_MEMORY[session_id] = {
-            "messages": [],
+            "messages": deque(maxlen=SESSION_HISTORY_LIMIT),
             "last_updated": datetime.utcnow(),
         }
     else:
@@ -26,27 +72,98 @@ def get_or_create_session(session_id: str) -> List[Dict[str, str]]:
 
 def append_message(session_id: str, role: str, content: str):
     """Append a message to the session conversation."""
+    if REDIS_CLIENT is not None:
+        key = _session_key(session_id)
+        pipe = REDIS_CLIENT.pipeline()
+        pipe.rpush(key, json.dumps({"role": role, "content": content}))
+        pipe.ltrim(key, -SESSION_HISTORY_LIMIT, -1)
+        pipe.expire(key, SESSION_TIMEOUT_MINUTES * 60)
+        pipe.execute()
+        return
+    
     conversation = get_or_create_session(session_id)
     conversation.append({"role": role, "content": content})
 
 
-def clear_stale_sessions(timeout_minutes: int = 5):
+def clear_stale_sessions(timeout_minutes: int = SESSION_TIMEOUT_MINUTES):
     """Clear sessions that haven't been updated in the last N minutes."""
+    # Redis sessions expire on their own
+    if REDIS_CLIENT is not None:
+        return
+    
     now = datetime.utcnow()
     to_remove = []
-    for sid, data in SESSION_MEMORY.items():
+    # Copy the items since other request threads may add sessions meanwhile
+    for sid, data in list(SESSION_MEMORY.items()):
         last_updated = data["last_updated"]
         if (now - last_updated).total_seconds() > timeout_minutes * 60:
             to_remove.append(sid)
     for sid in to_remove:
-        del SESSION_MEMORY[sid]
+        SESSION_MEMORY.pop(sid, None)
+
+
+def _maybe_clear_stale_sessions():
+    """Run clear_stale_sessions if the last sweep was long enough ago."""
+    global _last_sweep
+    now = time.monotonic()
+    if now - _last_sweep < SESSION_SWEEP_INTERVAL_SECONDS:
+        return
+    _last_sweep = now
+    clear_stale_sessions()
+
+
+##############################################################################
+# Response Cache
+##############################################################################
+RESPONSE_CACHE_MAX_ENTRIES = 512
+RESPONSE_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+
+def response_cache_key(question: str, model: str) -> str:
+    """Build a cache key from the normalized question and the model answering it."""
+    normalized = " ".join(question.lower().split())
+    return "response:" + hashlib.sha1(f"{normalized}|{model}".encode("utf-8")).hexdigest()
+
+
+def get_cached_response(key: str) -> Optional[str]:
+    """Return a cached response, or None if it is missing or expired."""
+    if REDIS_CLIENT is not None:
+        return REDIS_CLIENT.get(key)
+    
+    with _RESPONSE_CACHE_LOCK:
+        entry = RESPONSE_CACHE.get(key)
+        if entry is None:
+            return None
+        response, expires_at = entry
+        if time.monotonic() > expires_at:
+            del RESPONSE_CACHE[key]
+            return None
+        RESPONSE_CACHE.move_to_end(key)
+        return response
+
+
+def cache_response(key: str, response: str, ttl_seconds: int):
+    """Cache a response for ttl_seconds, evicting the least recently used entries."""
+    if REDIS_CLIENT is not None:
+        REDIS_CLIENT.set(key, response, ex=ttl_seconds)
+        return
+    
+    with _RESPONSE_CACHE_LOCK:
+        RESPONSE_CACHE[key] = (response, time.monotonic() + ttl_seconds)
+        RESPONSE_CACHE.move_to_end(key)
+        while len(RESPONSE_CACHE) > RESPONSE_CACHE_MAX_ENTRIES:
+            RESPONSE_CACHE.popitem(last=False)
 
 
 def load_json_data(file_path: str) -> dict:
-    """Load JSON data from file."""
+    """Load JSON data from file, using orjson when it is installed."""
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Data file '{file_path}' not found.")
     
+    if ORJSON_SUPPORT:
+        with open(file_path, "rb") as f:
+            return orjson.loads(f.read())
     with open(file_path, "r", encoding="utf-8") as f:
         return json.load(f)
 